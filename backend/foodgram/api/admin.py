@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from .models import ProfilingRule
+
+
+@admin.register(ProfilingRule)
+class ProfilingRuleAdmin(admin.ModelAdmin):
+    list_display = ('view', 'sample_rate', 'enabled')
+    list_editable = ('sample_rate', 'enabled')
+    search_fields = ('view',)
@@ -0,0 +1,143 @@
+import base64
+import binascii
+import io
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from receipt.renditions import check_image_size
+
+BASE64_PREFIX = ';base64,'
+BASE64_CHUNK_SIZE = 1 << 16
+IMAGE_HEADER_LIMIT = 1 << 20
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+
+def fetch_in_bulk(queryset, ids):
+    objects = queryset.in_bulk(set(ids))
+    missing = [pk for pk in dict.fromkeys(ids) if pk not in objects]
+    return objects, missing
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        relation = self.child_relation
+        ids = [relation.to_pk(item) for item in data]
+        objects, missing = fetch_in_bulk(relation.get_queryset(), ids)
+        if missing:
+            relation.fail(
+                'does_not_exist', pk_value=', '.join(map(str, missing)))
+        return [objects[pk] for pk in ids]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class RecipeImageField(serializers.ImageField):
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение.',
+        'image_format': 'Допустимые форматы изображения: JPEG, PNG, GIF.',
+        'image_too_large': (
+            'Изображение не должно превышать {max_pixels} пикселей.'),
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode_base64(data)
+        elif hasattr(data, 'read'):
+            try:
+                fits = check_image_size(data)
+            except OSError:
+                self.fail('invalid_image')
+            if not fits:
+                self.fail('image_too_large',
+                          max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        return super().to_internal_value(data)
+
+    def decode_base64(self, data):
+        # Decode slice by slice straight into a temporary file, so the
+        # decoded image is never held in memory as a whole.
+        start = data.find(BASE64_PREFIX)
+        start = 0 if start == -1 else start + len(BASE64_PREFIX)
+        file = TemporaryUploadedFile('image', None, 0, None)
+        header = b''
+        extension = None
+        try:
+            for chunk in self.base64_chunks(data, start):
+                file.write(chunk)
+                if extension is None:
+                    header += chunk
+                    extension = self.sniff(header)
+                    if extension is None and len(header) > IMAGE_HEADER_LIMIT:
+                        self.fail('invalid_image')
+            if extension is None:
+                self.fail('invalid_image')
+        except serializers.ValidationError:
+            file.close()
+            raise
+        file.size = file.tell()
+        file.name = f'{uuid.uuid4()}.{extension}'
+        file.seek(0)
+        return file
+
+    def base64_chunks(self, data, start):
+        # Line breaks and spaces are dropped before decoding, and the
+        # characters past the last full 4-character group are carried
+        # into the next slice, so every slice decodes on its own.
+        pending = ''
+        for position in range(start, len(data), BASE64_CHUNK_SIZE):
+            pending += ''.join(
+                data[position:position + BASE64_CHUNK_SIZE].split())
+            aligned = len(pending) - len(pending) % 4
+            yield self.b64decode(pending[:aligned])
+            pending = pending[aligned:]
+        if pending:
+            self.fail('invalid_image')
+
+    def b64decode(self, data):
+        try:
+            return base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_image')
+
+    def sniff(self, header):
+        try:
+            with Image.open(io.BytesIO(header)) as image:
+                image_format, (width, height) = image.format, image.size
+        except Image.DecompressionBombError:
+            self.fail('image_too_large',
+                      max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        except OSError:
+            return None
+        if image_format not in IMAGE_EXTENSIONS:
+            self.fail('image_format')
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail('image_too_large',
+                      max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        return IMAGE_EXTENSIONS[image_format]
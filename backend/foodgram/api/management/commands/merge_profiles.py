@@ -0,0 +1,78 @@
+import os
+import sys
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from foodgram.profiling import PROFILE_EXTENSION
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise CommandError(f'Неверная дата: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def profile_time(filename):
+    try:
+        return int(filename.split('-', 1)[0]) / 1000
+    except ValueError:
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Объединяет профили запросов за период в один файл '
+            'collapsed stacks для построения flame graph.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', help='Начало периода, по умолчанию час назад.')
+        parser.add_argument('--until', help='Конец периода.')
+        parser.add_argument(
+            '--view', action='append',
+            help='Учитывать только указанные представления.')
+        parser.add_argument('--directory', default=settings.PROFILER_DIR)
+        parser.add_argument('--output', help='Файл результата.')
+
+    def handle(self, *args, **options):
+        since = (parse_moment(options['since']) if options['since']
+                 else timezone.now() - timedelta(hours=1)).timestamp()
+        until = (parse_moment(options['until']).timestamp()
+                 if options['until'] else None)
+        views = set(options['view'] or ())
+        stacks = Counter()
+        merged = 0
+        try:
+            filenames = sorted(os.listdir(options['directory']))
+        except OSError as error:
+            raise CommandError(error)
+        for filename in filenames:
+            created = profile_time(filename)
+            if (not filename.endswith(PROFILE_EXTENSION) or created is None
+                    or created < since
+                    or until is not None and created > until):
+                continue
+            with open(os.path.join(options['directory'], filename)) as file:
+                for line in file:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if views and stack.split(';', 1)[0] not in views:
+                        continue
+                    stacks[stack] += int(count)
+            merged += 1
+        output = (open(options['output'], 'w') if options['output']
+                  else sys.stdout)
+        try:
+            for stack in sorted(stacks):
+                output.write(f'{stack} {stacks[stack]}\n')
+        finally:
+            if options['output']:
+                output.close()
+        self.stderr.write(
+            f'Профилей: {merged}, сэмплов: {sum(stacks.values())}.')
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:45
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(help_text='Например, RecipeViewSet.download_shopping_cart', max_length=200, unique=True, verbose_name='Представление')),
+                ('sample_rate', models.FloatField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(1)], verbose_name='Доля профилируемых запросов')),
+                ('enabled', models.BooleanField(default=True, verbose_name='Включено')),
+            ],
+            options={
+                'verbose_name': 'Правило профилирования',
+                'verbose_name_plural': 'Правила профилирования',
+                'ordering': ('view',),
+            },
+        ),
+    ]
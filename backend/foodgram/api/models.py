@@ -0,0 +1,24 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models
+
+
+class ProfilingRule(models.Model):
+    view = models.CharField(
+        max_length=200,
+        unique=True,
+        verbose_name='Представление',
+        help_text='Например, RecipeViewSet.download_shopping_cart'
+    )
+    sample_rate = models.FloatField(
+        validators=[MinValueValidator(0), MaxValueValidator(1)],
+        verbose_name='Доля профилируемых запросов'
+    )
+    enabled = models.BooleanField(default=True, verbose_name='Включено')
+
+    class Meta:
+        verbose_name = 'Правило профилирования'
+        verbose_name_plural = 'Правила профилирования'
+        ordering = ('view',)
+
+    def __str__(self):
+        return self.view
@@ -1,10 +1,22 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Manager
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from receipt.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingList, Tag)
+from api.fields import (BulkPrimaryKeyRelatedField, RecipeImageField,
+                        fetch_in_bulk)
+from receipt.blobs import recipe_file_names, release_files_on_commit
+from receipt.cache import bump_recipe_versions, get_recipe_documents
+from receipt.carts import apply_deltas, recipe_line_deltas
+from receipt.fulltext import schedule_search_refresh
+from receipt.renditions import reset_renditions, schedule_renditions
+from receipt.models import (CartIngredientTotal, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingList, Tag)
+from receipt.signals import muted_line_signals
 from users.models import Subscribe, User
 
 
@@ -19,14 +31,21 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
+    followers_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
         fields = (
             'id', 'email', 'username', 'first_name', 'last_name',
-            'is_subscribed')
+            'is_subscribed', 'recipes_count', 'followers_count')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        subscriptions = self.context.get('subscriptions')
+        if subscriptions is not None:
+            return obj.id in subscriptions
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -77,14 +96,18 @@ class SubscribeListSerializer(serializers.ModelSerializer):
 
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
+    followers_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
         fields = ('id', 'email', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'recipes', 'recipes_count')
+                  'last_name', 'is_subscribed', 'recipes', 'recipes_count',
+                  'followers_count')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return 0
@@ -94,16 +117,24 @@ class SubscribeListSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit is not None:
-            recipes = obj.recipes.all()[:int(recipes_limit)]
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.pk, [])
         else:
-            recipes = obj.recipes.all()
+            recipes = obj.recipes.all().latest_per_author()
+            recipes_limit = get_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeSubscribeSerializer(
             recipes, many=True, context={'request': request}).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+
+def get_recipes_limit(request):
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return max(recipes_limit, 0)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -124,8 +155,35 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'amount', 'measurement_unit')
 
 
+class CartIngredientTotalSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+    amount = serializers.ReadOnlyField(source='total')
+
+    class Meta:
+        model = CartIngredientTotal
+        fields = ('id', 'name', 'amount', 'measurement_unit')
+
+
+class IngredientsInRecipesListSerializer(serializers.ListSerializer):
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients, missing = fetch_in_bulk(
+            Ingredient.objects.all(), [item['id'] for item in items])
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                f'{", ".join(map(str, missing))}.')
+        for item in items:
+            item['id'] = ingredients[item['id']]
+        return items
+
+
 class IngredientsInRecipesPostSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(write_only=True)
 
     class Meta:
@@ -134,130 +192,220 @@ class IngredientsInRecipesPostSerializer(serializers.ModelSerializer):
             'id',
             'amount'
         )
+        list_serializer_class = IngredientsInRecipesListSerializer
+
+
+class AuthorDocumentSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = ('id', 'email', 'username', 'first_name', 'last_name')
+
+
+class RecipeDocumentSerializer(serializers.ModelSerializer):
+    tags = TagSerializer(many=True, read_only=True)
+    author = AuthorDocumentSerializer(read_only=True)
+    ingredients = RecipeIngredientSerializer(
+        source='recipe_ingredients', many=True, read_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'name', 'tags', 'author', 'ingredients', 'image',
+            'image_thumbnail', 'image_webp', 'text', 'cooking_time',
+        )
+
+
+def render_recipe_document(recipe):
+    return RecipeDocumentSerializer(recipe).data
+
+
+class RecipeReadListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        documents = get_recipe_documents(recipes, render_recipe_document)
+        return [
+            self.child.personalize(recipe, documents[recipe.pk])
+            for recipe in recipes
+        ]
 
 
 class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField(read_only=True)
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    ingredients = RecipeIngredientSerializer(
+        source='recipe_ingredients', many=True, read_only=True)
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    favorites_count = serializers.IntegerField(read_only=True)
+    in_carts_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'name', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'image', 'image_thumbnail', 'image_webp',
+            'text', 'cooking_time', 'favorites_count', 'in_carts_count',
         )
+        list_serializer_class = RecipeReadListSerializer
 
-    def get_ingredients(self, obj):
-        queryset = RecipeIngredient.objects.filter(recipe=obj)
-        return RecipeIngredientSerializer(queryset, many=True).data
-
-    def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(user=request.user, recipe=obj).exists()
-
-    def get_is_in_shopping_cart(self, obj):
+    def to_representation(self, instance):
+        documents = get_recipe_documents([instance], render_recipe_document)
+        return self.personalize(instance, documents[instance.pk])
+
+    def personalize(self, instance, document):
+        # Counters change with every favorite, so they are read from the
+        # instance rather than from the cached document.
+        author = dict(document['author'])
+        author['is_subscribed'] = self.fields['author'].get_is_subscribed(
+            instance.author)
+        author['recipes_count'] = instance.author.recipes_count
+        author['followers_count'] = instance.author.followers_count
+        personal = {
+            'author': author,
+            'is_favorited': bool(instance.is_favorited),
+            'is_in_shopping_cart': bool(instance.is_in_shopping_cart),
+            'favorites_count': instance.favorites_count,
+            'in_carts_count': instance.in_carts_count,
+        }
         request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return ShoppingList.objects.filter(
-            user=request.user, recipe=obj).exists()
+        if request is not None:
+            for field in ('image', 'image_thumbnail', 'image_webp'):
+                if document[field]:
+                    personal[field] = request.build_absolute_uri(
+                        document[field])
+        return OrderedDict(
+            (field, personal[field] if field in personal else document[field])
+            for field in self.Meta.fields
+        )
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True)
     ingredients = IngredientsInRecipesPostSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'name', 'image', 'text', 'cooking_time')
 
-    def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
+    def validate_ingredients(self, ingredients):
         ingredients_list = []
         for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError({
-                    'ingredients': 'Ингредиенты должны быть уникальными!'
-                })
-            ingredients_list.append(ingredient_id)
-            amount = ingredient['amount']
-            if int(amount) <= 0:
-                raise serializers.ValidationError({
-                    'amount': 'Количество ингредиента должно быть больше нуля!'
-                })
-
-        cooking_time = self.initial_data.get('cooking_time')
-        if float(cooking_time) <= 0:
-            raise serializers.ValidationError({
-                'cooking_time': 'Время приготовления должно быть больше нуля!'
-            })
-
-        return data
-
-    def validate_tag(self, data):
-        tags = self.initial_data.get('tags')
-        if tags is None:
+            if ingredient['id'] in ingredients_list:
+                raise serializers.ValidationError(
+                    'Ингредиенты должны быть уникальными!')
+            ingredients_list.append(ingredient['id'])
+            if ingredient['amount'] <= 0:
+                raise serializers.ValidationError(
+                    'Количество ингредиента должно быть больше нуля!')
+        return ingredients
+
+    def validate_cooking_time(self, cooking_time):
+        if cooking_time <= 0:
             raise serializers.ValidationError(
-                'Добавьте тэг!'
-            )
-        tags_list = len(tags)
-        tags_set = len(
-            set([tag['id'] for tag in tags])
-        )
-        if tags_list > tags_set:
+                'Время приготовления должно быть больше нуля!')
+        return cooking_time
+
+    def validate_tags(self, tags):
+        if not tags:
+            raise serializers.ValidationError('Добавьте тэг!')
+        if len(tags) > len(set(tags)):
             raise serializers.ValidationError('Тэг должен быть уникальным!')
-        return data
+        return tags
 
     @staticmethod
-    def create_ingredients(ingredients, recipe):
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredients=ingredient['id'],
-                amount=ingredient['amount'],
-            )
+    def write_ingredients(recipe, ingredients, created=False):
+        wanted = {item['id'].pk: item['amount'] for item in ingredients}
+        existing = {} if created else {
+            line.ingredients_id: line
+            for line in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        changes = {}
+        stale = []
+        changed = []
+        for ingredient_id, line in existing.items():
+            if ingredient_id not in wanted:
+                stale.append(line.pk)
+                changes[ingredient_id] = (-line.amount, -1)
+            elif line.amount != wanted[ingredient_id]:
+                changes[ingredient_id] = (
+                    wanted[ingredient_id] - line.amount, 0)
+                line.amount = wanted[ingredient_id]
+                changed.append(line)
+        new = []
+        for ingredient_id, amount in wanted.items():
+            if ingredient_id not in existing:
+                changes[ingredient_id] = (amount, 1)
+                new.append(RecipeIngredient(
+                    recipe=recipe, ingredients_id=ingredient_id,
+                    amount=amount))
+        if stale:
+            with muted_line_signals():
+                RecipeIngredient.objects.filter(pk__in=stale).delete()
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        RecipeIngredient.objects.bulk_create(new)
+        if changes and not created:
+            apply_deltas(recipe_line_deltas(recipe.pk, changes))
+            bump_recipe_versions([recipe.pk])
+            schedule_search_refresh([recipe.pk])
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                # The decoded upload has been moved into storage; closing it
+                # stops the temporary file from being unlinked a second time.
+                image.close()
 
     def create(self, validated_data):
         tags = validated_data.pop('tags')
-        ingredient = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(
-            author=self.context['request'].user, **validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients(ingredient, recipe)
+        ingredients = validated_data.pop('ingredients')
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                author=self.context['request'].user, **validated_data)
+            recipe.tags.set(tags)
+            self.write_ingredients(recipe, ingredients, created=True)
+            schedule_renditions(recipe)
         return recipe
 
     def update(self, instance, validated_data):
-        tags = self.context['request'].data['tags']
-        instance.tags.set(tags)
-        instance.name = validated_data.get('name', instance.image)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time',
-            instance.cooking_time
-        )
-        instance.image = validated_data.get('image', instance.image)
-        if 'ingredients' in self.initial_data:
-            ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
-        instance.save()
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        replaced = []
+        # Only the submitted fields are written: the renditions may have
+        # been stored by the image pool after this instance was loaded.
+        update_fields = list(validated_data)
+        if 'image' in validated_data:
+            replaced = recipe_file_names(instance)
+            reset_renditions(instance)
+            update_fields.extend(settings.RECIPE_IMAGE_RENDITIONS)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        with transaction.atomic():
+            if tags is not None:
+                instance.tags.set(tags)
+            if ingredients is not None:
+                self.write_ingredients(instance, ingredients)
+            if update_fields:
+                instance.save(update_fields=update_fields)
+            if replaced:
+                schedule_renditions(instance)
+                release_files_on_commit(replaced)
         return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
-        context = {'request': request}
+        instance = Recipe.objects.with_related().annotate_user_flags(
+            request.user).get(pk=instance.pk)
         return RecipeReadSerializer(
-            instance, context=context).data
+            instance, context=self.context).data
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -282,7 +430,8 @@ class FavoriteSerializer(serializers.ModelSerializer):
 class RepresentationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_thumbnail', 'image_webp',
+                  'cooking_time')
 
 
 class ShoppingListSerializer(serializers.ModelSerializer):
@@ -0,0 +1,1004 @@
+import atexit
+import base64
+import io
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from itertools import count
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.serializers import ValidationError
+from rest_framework.test import APIClient
+
+from api.fields import RecipeImageField
+from api.models import ProfilingRule
+from api.serializers import RecipeSerializer
+from foodgram.metrics import QueryTracker, Registry, render_prometheus
+from foodgram.profiling import SampleRates, StackSampler
+from receipt.cache import RECIPE_VERSION_KEY
+from receipt.models import (CartIngredientTotal, Favorite, FeedEntry,
+                            Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            ShoppingList, Tag)
+from receipt.renditions import render_now
+from users.models import Subscribe, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+SMALL = 2
+LARGE = 5
+QUERY_BUDGETS = {
+    'recipe_list': 6,
+    'recipe_list_anonymous': 4,
+    'recipe_detail': 5,
+    'recipe_create': 16,
+    'recipe_update': 29,
+    'favorite_add': 5,
+    'favorite_remove': 6,
+    'cart_add': 11,
+    'cart_remove': 12,
+    'download_shopping_cart': 3,
+    'subscriptions': 4,
+    'feed': 8,
+    'ingredient_list': 2,
+    'ingredient_search': 2,
+    'tag_list': 2,
+    'user_list': 3,
+    'user_detail': 2,
+    'user_me': 2,
+}
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def duplicated_queries(queries):
+    shapes = Counter(LITERAL_RE.sub('?', sql) for sql in queries)
+    return [(times, shape) for shape, times in shapes.items() if times > 1]
+
+
+def encoded_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.numbers = count()
+        self.user = self.create_user()
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def create_user(self):
+        number = next(self.numbers)
+        return User.objects.create_user(
+            email=f'user{number}@example.com', username=f'user{number}',
+            first_name='Имя', last_name='Фамилия', password='password')
+
+    def create_tags(self, size):
+        tags = []
+        for _ in range(size):
+            number = next(self.numbers)
+            tags.append(Tag.objects.create(
+                name=f'Тег {number}', color=f'#{number:06d}',
+                slug=f'tag-{number}'))
+        return tags
+
+    def create_ingredients(self, size):
+        return [
+            Ingredient.objects.create(
+                name=f'мука {next(self.numbers)}', measurement_unit='г')
+            for _ in range(size)
+        ]
+
+    def create_recipe(self, author=None, size=SMALL):
+        recipe = Recipe.objects.create(
+            author=author or self.create_user(),
+            name=f'Рецепт {next(self.numbers)}', text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredients=ingredient,
+                             amount=100)
+            for ingredient in self.create_ingredients(size))
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for tag in self.create_tags(size))
+        return recipe
+
+    def recipe_payload(self, size):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': encoded_image(),
+            'tags': [tag.pk for tag in self.create_tags(size)],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 50}
+                for ingredient in self.create_ingredients(size)
+            ],
+        }
+
+    def capture(self, request):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, response)
+        return [query['sql'] for query in context.captured_queries]
+
+    def report(self, name, size, queries):
+        lines = [f'{name}, размер {size}: {len(queries)} SQL-запросов']
+        for times, shape in duplicated_queries(queries):
+            lines.append(f'{times} x {shape}')
+        return '\n'.join(lines)
+
+    def assert_query_budget(self, name, prepare):
+        small = self.capture(prepare(SMALL))
+        large = self.capture(prepare(LARGE))
+        message = '\n\n'.join((self.report(name, SMALL, small),
+                               self.report(name, LARGE, large)))
+        self.assertEqual(len(small), len(large), message)
+        self.assertLessEqual(len(large), QUERY_BUDGETS[name], message)
+
+    def test_recipe_list(self):
+        def prepare(size):
+            for _ in range(size):
+                recipe = self.create_recipe(size=size)
+                Favorite.objects.create(user=self.user, recipe=recipe)
+                ShoppingList.objects.create(user=self.user, recipe=recipe)
+                Subscribe.objects.create(
+                    user=self.user, author=recipe.author)
+            return lambda: self.client.get('/api/recipes/')
+
+        self.assert_query_budget('recipe_list', prepare)
+
+    def test_recipe_list_anonymous(self):
+        self.client.credentials()
+
+        def prepare(size):
+            for _ in range(size):
+                self.create_recipe(size=size)
+            return lambda: self.client.get('/api/recipes/')
+
+        self.assert_query_budget('recipe_list_anonymous', prepare)
+
+    def test_recipe_detail(self):
+        def prepare(size):
+            recipe = self.create_recipe(size=size)
+            return lambda: self.client.get(f'/api/recipes/{recipe.pk}/')
+
+        self.assert_query_budget('recipe_detail', prepare)
+
+    def test_recipe_create(self):
+        def prepare(size):
+            payload = self.recipe_payload(size)
+            return lambda: self.client.post(
+                '/api/recipes/', payload, format='json')
+
+        self.assert_query_budget('recipe_create', prepare)
+
+    def test_recipe_update(self):
+        def prepare(size):
+            recipe = self.create_recipe(author=self.user, size=size)
+            for _ in range(size):
+                ShoppingList.objects.create(
+                    user=self.create_user(), recipe=recipe)
+            payload = self.recipe_payload(size)
+            return lambda: self.client.patch(
+                f'/api/recipes/{recipe.pk}/', payload, format='json')
+
+        self.assert_query_budget('recipe_update', prepare)
+
+    def test_favorite_add(self):
+        def prepare(size):
+            recipe = self.create_recipe(size=size)
+            return lambda: self.client.post(
+                f'/api/recipes/{recipe.pk}/favorite/')
+
+        self.assert_query_budget('favorite_add', prepare)
+
+    def test_favorite_remove(self):
+        def prepare(size):
+            recipe = self.create_recipe(size=size)
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            return lambda: self.client.delete(
+                f'/api/recipes/{recipe.pk}/favorite/')
+
+        self.assert_query_budget('favorite_remove', prepare)
+
+    def test_cart_add(self):
+        def prepare(size):
+            recipe = self.create_recipe(size=size)
+            return lambda: self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+        self.assert_query_budget('cart_add', prepare)
+
+    def test_cart_remove(self):
+        def prepare(size):
+            recipe = self.create_recipe(size=size)
+            ShoppingList.objects.create(user=self.user, recipe=recipe)
+            return lambda: self.client.delete(
+                f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+        self.assert_query_budget('cart_remove', prepare)
+
+    def test_download_shopping_cart(self):
+        def prepare(size):
+            for _ in range(size):
+                ShoppingList.objects.create(
+                    user=self.user, recipe=self.create_recipe(size=size))
+            return lambda: self.client.get(
+                '/api/recipes/download_shopping_cart/')
+
+        self.assert_query_budget('download_shopping_cart', prepare)
+
+    def test_subscriptions(self):
+        def prepare(size):
+            for _ in range(size):
+                author = self.create_user()
+                Subscribe.objects.create(user=self.user, author=author)
+                for _ in range(size):
+                    self.create_recipe(author=author, size=size)
+            return lambda: self.client.get('/api/users/subscriptions/')
+
+        self.assert_query_budget('subscriptions', prepare)
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_feed(self):
+        def prepare(size):
+            for number in range(size):
+                author = self.create_user()
+                Subscribe.objects.create(user=self.user, author=author)
+                if number % 2:
+                    Subscribe.objects.create(
+                        user=self.create_user(), author=author)
+                for _ in range(size):
+                    self.create_recipe(author=author, size=size)
+            return lambda: self.client.get('/api/recipes/feed/')
+
+        self.assert_query_budget('feed', prepare)
+
+    def test_ingredient_list(self):
+        def prepare(size):
+            self.create_ingredients(size)
+            return lambda: self.client.get('/api/ingredients/')
+
+        self.assert_query_budget('ingredient_list', prepare)
+
+    def test_ingredient_search(self):
+        def prepare(size):
+            self.create_ingredients(size)
+            return lambda: self.client.get('/api/ingredients/?name=му')
+
+        self.assert_query_budget('ingredient_search', prepare)
+
+    def test_tag_list(self):
+        def prepare(size):
+            self.create_tags(size)
+            return lambda: self.client.get('/api/tags/')
+
+        self.assert_query_budget('tag_list', prepare)
+
+    def test_user_list(self):
+        def prepare(size):
+            for _ in range(size):
+                Subscribe.objects.create(
+                    user=self.user, author=self.create_user())
+            return lambda: self.client.get('/api/users/')
+
+        self.assert_query_budget('user_list', prepare)
+
+    def test_user_detail(self):
+        def prepare(size):
+            author = self.create_user()
+            for _ in range(size):
+                self.create_recipe(author=author)
+            Subscribe.objects.create(user=self.user, author=author)
+            return lambda: self.client.get(f'/api/users/{author.pk}/')
+
+        self.assert_query_budget('user_detail', prepare)
+
+    def test_user_me(self):
+        def prepare(size):
+            for _ in range(size):
+                Subscribe.objects.create(
+                    user=self.user, author=self.create_user())
+            return lambda: self.client.get('/api/users/me/')
+
+        self.assert_query_budget('user_me', prepare)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class CounterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+
+    def test_recipe_save_keeps_counters(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingList.objects.create(user=self.user, recipe=self.recipe)
+        stale.name = 'Новое название'
+        stale.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.in_carts_count, 1)
+
+    def test_user_save_keeps_counters(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Subscribe.objects.create(user=self.user, author=self.author)
+        stale.set_password('new-password')
+        stale.save()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertTrue(self.author.check_password('new-password'))
+
+    def test_counters_are_serialized(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Subscribe.objects.create(user=self.user, author=self.author)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        recipe = client.get(f'/api/recipes/{self.recipe.pk}/').json()
+        self.assertEqual(
+            (recipe['favorites_count'], recipe['in_carts_count']), (1, 0))
+        self.assertEqual(
+            (recipe['author']['recipes_count'],
+             recipe['author']['followers_count']), (1, 1))
+        ShoppingList.objects.create(user=self.user, recipe=self.recipe)
+        recipe = client.get('/api/recipes/').json()['results'][0]
+        self.assertEqual(recipe['in_carts_count'], 1)
+        author = client.get('/api/users/subscriptions/').json()['results'][0]
+        self.assertEqual(
+            (author['recipes_count'], author['followers_count']), (1, 1))
+
+    def test_counters_are_read_only(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.patch(
+            f'/api/recipes/{self.recipe.pk}/', {'favorites_count': 100},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['favorites_count'], 0)
+
+    def test_popular_ordering(self):
+        popular = Recipe.objects.create(
+            author=self.author, name='Популярный', text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+        Favorite.objects.create(user=self.user, recipe=popular)
+        Favorite.objects.create(user=self.author, recipe=popular)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get('/api/recipes/?ordering=popular')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [popular.pk, self.recipe.pk])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_missing_recipe_creates_no_version(self):
+        for pk in ('abc', '999999'):
+            response = self.client.get(f'/api/recipes/{pk}/')
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('ETag', response)
+            self.assertIsNone(cache.get(RECIPE_VERSION_KEY.format(pk)))
+
+    def test_recipe_etag(self):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+        path = f'/api/recipes/{recipe.pk}/'
+        self.client.get(path)
+        etag = self.client.get(path)['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class RecipeIngredientDiffTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.tag = Tag.objects.create(
+            name='Тег', color='#000000', slug='tag')
+        self.flour, self.milk, self.eggs = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'молоко', 'яйца'))
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+        RecipeTag.objects.create(recipe=self.recipe, tag=self.tag)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=self.recipe, ingredients=ingredient,
+                             amount=100)
+            for ingredient in (self.flour, self.milk))
+        ShoppingList.objects.create(user=self.author, recipe=self.recipe)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_update_applies_diff(self):
+        path = f'/api/recipes/{self.recipe.pk}/'
+        self.client.get(path)
+        response = self.client.patch(path, {
+            'tags': [self.tag.pk],
+            'ingredients': [
+                {'id': self.milk.pk, 'amount': 150},
+                {'id': self.eggs.pk, 'amount': 2},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        totals = dict(CartIngredientTotal.objects.filter(
+            user=self.author).values_list('ingredient_id', 'total'))
+        self.assertEqual(totals, {self.milk.pk: 150, self.eggs.pk: 2})
+        amounts = {
+            line['id']: line['amount']
+            for line in self.client.get(path).json()['ingredients']
+        }
+        self.assertEqual(amounts, {self.milk.pk: 150, self.eggs.pk: 2})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class RecipeRenditionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_update_keeps_stored_renditions(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+        stale = Recipe.objects.get(pk=recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image_thumbnail='receipt/thumbnails/recipe.jpg')
+        serializer = RecipeSerializer(
+            stale, data={'name': 'Новое название'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(
+            recipe.image_thumbnail.name, 'receipt/thumbnails/recipe.jpg')
+
+    @override_settings(
+        RECIPE_IMAGE_RENDITIONS={'image_webp': ('UNKNOWN', (10, 10))})
+    def test_rendition_failure_keeps_created_recipe(self):
+        tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г')
+        payload = {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': encoded_image(),
+            'tags': [tag.pk],
+            'ingredients': [{'id': ingredient.pk, 'amount': 50}],
+        }
+        with self.assertLogs('receipt.renditions', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    '/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(Recipe.objects.filter(name='Рецепт').exists())
+
+    def create_with_image(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+        os.makedirs(os.path.join(MEDIA_ROOT, 'receipt/images'), exist_ok=True)
+        with open(os.path.join(MEDIA_ROOT, recipe.image.name), 'wb') as file:
+            file.write(base64.b64decode(encoded_image().split(',')[1]))
+        return recipe
+
+    def test_failing_encoder_keeps_other_rendition(self):
+        recipe = self.create_with_image()
+        original_save = Image.Image.save
+
+        def save(image, target, image_format=None, **params):
+            if image_format == 'WEBP':
+                raise OSError('encoder error')
+            return original_save(image, target, image_format, **params)
+
+        with mock.patch.object(Image.Image, 'save', save):
+            with self.assertLogs('receipt.renditions', 'ERROR'):
+                failed = render_now(recipe.pk, recipe.image.name)
+        self.assertEqual(list(failed), ['image_webp'])
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_thumbnail.name.endswith('.jpg'))
+        self.assertEqual(recipe.image_webp.name, '')
+
+    def test_missing_webp_codec_is_skipped(self):
+        recipe = self.create_with_image()
+        with mock.patch('receipt.renditions.features.check',
+                        return_value=False):
+            with self.assertLogs('receipt.renditions', 'ERROR'):
+                render_now(recipe.pk, recipe.image.name)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_thumbnail.name.endswith('.jpg'))
+        self.assertEqual(recipe.image_webp.name, '')
+
+
+class ShoppingCartExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='password')
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, amount=number,
+                ingredients=Ingredient.objects.create(
+                    name=f'мука {number:02d}', measurement_unit='г'))
+            for number in range(1, 61))
+        ShoppingList.objects.create(user=self.user, recipe=recipe)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'file_format': file_format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        rows = self.download('csv').decode().splitlines()
+        self.assertEqual(
+            rows[0], '№,Ингредиент,Количество,Единица измерения')
+        self.assertEqual(rows[1], '1,мука 01,1.0,г')
+        self.assertEqual(rows[-1], '60,мука 60,60.0,г')
+        self.assertEqual(len(rows), 61)
+
+    def test_pdf_is_well_formed(self):
+        content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF-'))
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+        startxref = int(content.rsplit(b'startxref\n', 1)[1].split()[0])
+        self.assertTrue(content[startxref:].startswith(b'xref\n'))
+        lines = content[startxref:].split(b'\n')
+        size = int(lines[1].split()[1])
+        for number, entry in enumerate(lines[3:size + 1], start=1):
+            offset = int(entry.split()[0])
+            self.assertTrue(
+                content[offset:].startswith(b'%d 0 obj' % number), number)
+        for length, stream in re.findall(
+                rb'/Length (\d+) >>\nstream\n(.*?)\nendstream', content,
+                re.DOTALL):
+            self.assertEqual(int(length), len(stream))
+        self.assertIn(b'/Count 2', content)
+        self.assertIn(b'(60 muka 60 - 60.0 g) Tj', content)
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'file_format': 'xyz'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+
+    def create_recipes(self, size):
+        return [
+            Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}', text='Описание',
+                image='receipt/images/recipe.png', cooking_time=10)
+            for number in range(size)
+        ]
+
+    def walk(self, url, between_pages=None):
+        received = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            received.extend(
+                recipe['id'] for recipe in response.json()['results'])
+            url = response.json()['next']
+            if between_pages is not None:
+                between_pages()
+                between_pages = None
+        return received
+
+    def test_pages_are_stable_across_inserts(self):
+        recipes = self.create_recipes(5)
+        received = self.walk(
+            '/api/recipes/?cursor=&limit=2',
+            between_pages=lambda: self.create_recipes(3))
+        self.assertEqual(
+            received, [recipe.pk for recipe in reversed(recipes)])
+
+    def test_ties_on_pub_date_are_broken_by_id(self):
+        recipes = self.create_recipes(5)
+        Recipe.objects.update(pub_date=recipes[0].pub_date)
+        received = self.walk('/api/recipes/?cursor=&limit=2')
+        self.assertEqual(
+            received, sorted((recipe.pk for recipe in recipes), reverse=True))
+
+    def test_invalid_cursor(self):
+        self.create_recipes(1)
+        for cursor in ('%%%', base64.urlsafe_b64encode(b'abc').decode(),
+                       base64.urlsafe_b64encode(b'not-a-date|1').decode(),
+                       base64.urlsafe_b64encode(
+                           b'2021-01-01T00:00:00|x').decode()):
+            response = self.client.get(f'/api/recipes/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.json()['detail'], 'Неверный курсор.')
+
+    def test_other_orderings_use_page_numbers(self):
+        self.create_recipes(3)
+        for ordering in ('trending', 'popular'):
+            response = self.client.get(
+                f'/api/recipes/?cursor=&ordering={ordering}&limit=2')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertIn('count', response.json())
+        self.assertIn('page=2', response.json()['next'])
+
+
+class RecipeImageFieldTests(SimpleTestCase):
+
+    def encode(self, image_format, size=(8, 8)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, image_format)
+        return buffer.getvalue(), base64.b64encode(buffer.getvalue()).decode()
+
+    def decode(self, data):
+        file = RecipeImageField().to_internal_value(data)
+        self.addCleanup(file.close)
+        return file
+
+    def assert_rejected(self, data, message):
+        with self.assertRaises(ValidationError) as context:
+            self.decode(data)
+        self.assertEqual(context.exception.detail, [message])
+
+    def test_multi_chunk_image_with_line_breaks(self):
+        content, encoded = self.encode('PNG', size=(64, 64))
+        wrapped = '\r\n'.join(
+            encoded[position:position + 76]
+            for position in range(0, len(encoded), 76))
+        with mock.patch('api.fields.BASE64_CHUNK_SIZE', 25):
+            file = self.decode(f'data:image/png;base64,{wrapped}\n')
+        self.assertEqual(file.read(), content)
+        self.assertTrue(file.name.endswith('.png'))
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_too_large(self):
+        self.assert_rejected(
+            self.encode('PNG', size=(20, 20))[1],
+            'Изображение не должно превышать 100 пикселей.')
+
+    def test_wrong_format(self):
+        self.assert_rejected(
+            self.encode('BMP')[1],
+            'Допустимые форматы изображения: JPEG, PNG, GIF.')
+
+    def test_broken_base64(self):
+        encoded = self.encode('PNG')[1]
+        for data in (encoded[:-1].rstrip('='), encoded + '!', 'не картинка'):
+            with self.subTest(data=data[-10:]):
+                self.assert_rejected(
+                    data, 'Загрузите корректное изображение.')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0,
+                   FEED_FANOUT_LIMIT=1)
+class FeedTests(TestCase):
+
+    def create_user(self, name):
+        return User.objects.create_user(
+            email=f'{name}@example.com', username=name,
+            first_name='Имя', last_name='Фамилия', password='password')
+
+    def test_feed_merges_pushed_and_pulled_recipes(self):
+        cache.clear()
+        reader = self.create_user('reader')
+        pushed = self.create_user('pushed')
+        pulled = self.create_user('pulled')
+        Subscribe.objects.create(user=reader, author=pushed)
+        Subscribe.objects.create(user=reader, author=pulled)
+        Subscribe.objects.create(
+            user=self.create_user('other'), author=pulled)
+        expected = []
+        for number in range(5):
+            for author in (pushed, pulled):
+                expected.append(Recipe.objects.create(
+                    author=author, name=f'Рецепт {number}',
+                    text='Описание', image='receipt/images/recipe.png',
+                    cooking_time=10))
+        self.assertEqual(FeedEntry.objects.filter(user=reader).count(), 5)
+        expected.sort(key=lambda recipe: (recipe.pub_date, recipe.pk),
+                      reverse=True)
+        client = APIClient()
+        client.force_authenticate(reader)
+        url = '/api/recipes/feed/?limit=3'
+        received = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            received.extend(
+                recipe['id'] for recipe in response.json()['results'])
+            url = response.json()['next']
+        self.assertEqual(received, [recipe.pk for recipe in expected])
+
+    def create_recipe(self, author, name):
+        return Recipe.objects.create(
+            author=author, name=name, text='Описание',
+            image='receipt/images/recipe.png', cooking_time=10)
+
+    def test_author_back_under_limit_is_fanned_out(self):
+        cache.clear()
+        reader = self.create_user('reader')
+        author = self.create_user('author')
+        Subscribe.objects.create(user=reader, author=author)
+        leaving = Subscribe.objects.create(
+            user=self.create_user('other'), author=author)
+        recipes = [self.create_recipe(author, f'Рецепт {number}')
+                   for number in range(3)]
+        self.assertFalse(FeedEntry.objects.exists())
+        leaving.delete()
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=reader).values_list(
+                'recipe_id', flat=True)),
+            {recipe.pk for recipe in recipes})
+
+    @override_settings(FEED_MAX_ENTRIES=2)
+    def test_timelines_are_trimmed_by_command(self):
+        cache.clear()
+        reader = self.create_user('reader')
+        author = self.create_user('author')
+        Subscribe.objects.create(user=reader, author=author)
+        recipes = [self.create_recipe(author, f'Рецепт {number}')
+                   for number in range(4)]
+        self.assertEqual(FeedEntry.objects.filter(user=reader).count(), 4)
+        call_command('trim_feeds', '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=reader).values_list(
+                'recipe_id', flat=True)),
+            {recipe.pk for recipe in recipes[-2:]})
+
+
+class IngredientEndpointTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for name in ('малина', 'марсала', 'молоко', 'молоко козье'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def names(self, query):
+        response = self.client.get(f'/api/ingredients/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_empty_prefix_falls_back_to_fuzzy(self):
+        self.assertEqual(self.names('name=малако')[0], 'молоко')
+
+    def test_fuzzy_flag(self):
+        self.assertEqual(self.names('name=молоко&fuzzy=1'),
+                         ['молоко', 'молоко козье'])
+        self.assertEqual(self.names('name=мо&fuzzy=1'),
+                         ['молоко', 'молоко козье'])
+
+
+@override_settings(METRICS_LATENCY_BUCKETS=(0.1, 1))
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.registry = Registry()
+        self.addCleanup(atexit.unregister, self.registry.exit)
+        for target in ('foodgram.metrics.registry', 'api.views.registry'):
+            patcher = mock.patch(target, self.registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_middleware_counts_queries_and_latency(self):
+        Tag.objects.create(name='Завтрак', color='#ffffff', slug='breakfast')
+        with override_settings(METRICS_DIR=''):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/tags/')
+            totals = self.registry.collect()
+        self.assertIn('db;dur=', response['Server-Timing'])
+        entry = totals['TagViewSet.list|GET']
+        self.assertEqual(entry['requests'], 1)
+        self.assertEqual(entry['queries'], len(context.captured_queries))
+        self.assertEqual(sum(entry['buckets']), 1)
+        self.assertGreater(entry['duration'], 0)
+
+    def test_prometheus_output(self):
+        totals = {'RecipeViewSet.list|GET': {
+            'requests': 3, 'buckets': [1, 1, 1], 'duration': 2.5,
+            'queries': 12, 'sql_duration': 0.25,
+        }}
+        labels = 'view="RecipeViewSet.list",method="GET"'
+        lines = render_prometheus(totals).splitlines()
+        for line in (
+                f'foodgram_requests_total{{{labels}}} 3',
+                f'foodgram_request_duration_seconds_bucket'
+                f'{{{labels},le="0.1"}} 1',
+                f'foodgram_request_duration_seconds_bucket'
+                f'{{{labels},le="1"}} 2',
+                f'foodgram_request_duration_seconds_bucket'
+                f'{{{labels},le="+Inf"}} 3',
+                f'foodgram_request_duration_seconds_sum{{{labels}}} '
+                '2.500000',
+                f'foodgram_sql_queries_total{{{labels}}} 12',
+                '# TYPE foodgram_request_duration_seconds histogram'):
+            self.assertIn(line, lines)
+
+    def test_metrics_endpoint(self):
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            first_name='Имя', last_name='Фамилия', password='password')
+        client = APIClient()
+        client.force_authenticate(admin)
+        with override_settings(METRICS_DIR=self.directory):
+            client.get('/api/tags/')
+            response = client.get('/api/_metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b'foodgram_requests_total{view="TagViewSet.list",method="GET"} 1',
+            response.content)
+
+    def record(self, registry):
+        registry.record('TagViewSet.list', 'GET', 0.05, QueryTracker())
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    @override_settings(METRICS_FILE_TTL=60)
+    def test_files_of_dead_workers_are_archived(self):
+        with override_settings(METRICS_DIR=self.directory):
+            self.record(self.registry)
+            self.registry.flush()
+            own = self.registry.path(os.getpid())
+            old, recent = self.dead_pid(), self.dead_pid()
+            for pid, age in ((old, 120), (recent, 0)):
+                shutil.copy(own, self.registry.path(pid))
+                stamp = time.time() - age
+                os.utime(self.registry.path(pid), (stamp, stamp))
+            for _ in range(2):
+                totals = self.registry.collect()
+                self.assertEqual(
+                    totals['TagViewSet.list|GET']['requests'], 3)
+            self.assertEqual(
+                sorted(os.listdir(self.directory)),
+                sorted(['.lock', 'archive.json', f'{os.getpid()}.json',
+                        f'{recent}.json']))
+
+    def test_exiting_worker_archives_its_file(self):
+        with override_settings(METRICS_DIR=self.directory):
+            self.record(self.registry)
+            self.registry.flush()
+            self.registry.exit()
+            self.assertFalse(
+                os.path.exists(self.registry.path(os.getpid())))
+            self.assertEqual(
+                Registry().collect()['TagViewSet.list|GET']['requests'], 1)
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        patcher = mock.patch('foodgram.profiling.sample_rates', SampleRates())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_matching_rule_writes_folded_profile(self):
+        ProfilingRule.objects.create(view='TagViewSet.list', sample_rate=1)
+        ProfilingRule.objects.create(
+            view='IngredientViewSet.list', sample_rate=1, enabled=False)
+        stop = StackSampler.stop
+
+        def stop_after_sample(sampler):
+            # A fast request may end before the first sample is taken.
+            deadline = time.monotonic() + 5
+            while not sampler.stacks and time.monotonic() < deadline:
+                time.sleep(sampler.interval)
+            return stop(sampler)
+
+        with override_settings(
+                PROFILER_ENABLED=True, PROFILER_SAMPLE_RATE=0,
+                PROFILER_DIR=self.directory), mock.patch.object(
+                StackSampler, 'stop', stop_after_sample):
+            self.client.get('/api/ingredients/')
+            self.assertEqual(self.profiles(), [])
+            self.client.get('/api/tags/')
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].endswith('-TagViewSet.list.folded'))
+        with open(os.path.join(self.directory, profiles[0])) as file:
+            lines = file.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertRegex(line, r'^TagViewSet\.list(;[^;]+)* \d+$')
+
+    def write(self, name, lines):
+        with open(os.path.join(self.directory, name), 'w') as file:
+            file.write(''.join(f'{line}\n' for line in lines))
+
+    def test_merge_profiles(self):
+        now = int(time.time() * 1000)
+        self.write(f'{now}-1-RecipeViewSet.list.folded', [
+            'RecipeViewSet.list;list;render 3', 'RecipeViewSet.list 1'])
+        self.write(f'{now + 1}-2-RecipeViewSet.list.folded', [
+            'RecipeViewSet.list;list;render 2',
+            'RecipeViewSet.list;list;query 4'])
+        self.write(f'{now + 2}-2-TagViewSet.list.folded', [
+            'TagViewSet.list;list 5'])
+        self.write(f'{now - 2 * 60 * 60 * 1000}-3-RecipeViewSet.list.folded',
+                   ['RecipeViewSet.list;list;render 100'])
+        output = os.path.join(self.directory, 'merged.txt')
+        call_command('merge_profiles', '--directory', self.directory,
+                     '--view', 'RecipeViewSet.list', '--output', output,
+                     stderr=io.StringIO())
+        with open(output) as file:
+            self.assertEqual(file.read().splitlines(), [
+                'RecipeViewSet.list 1',
+                'RecipeViewSet.list;list;query 4',
+                'RecipeViewSet.list;list;render 5',
+            ])
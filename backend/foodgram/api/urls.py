@@ -3,11 +3,14 @@ from rest_framework.routers import DefaultRouter
 
 from receipt.views import GetIngredientViewSet, RecipeViewSet, TagViewSet
 
+from .views import MetricsView
+
 r1 = DefaultRouter()
 r1.register('ingredients', GetIngredientViewSet)
 r1.register('recipes', RecipeViewSet, basename='recipes')
 r1.register('tags', TagViewSet)
 
 urlpatterns = [
+    path('_metrics', MetricsView.as_view(), name='metrics'),
     path('', include(r1.urls)),
 ]
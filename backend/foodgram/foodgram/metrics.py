@@ -0,0 +1,304 @@
+import atexit
+import copy
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'foodgram'
+UNRESOLVED_VIEW = 'unresolved'
+ARCHIVE_NAME = 'archive'
+LOCK_NAME = '.lock'
+
+
+class QueryTracker:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class Registry:
+    # Each worker keeps its own totals and periodically writes them to
+    # <METRICS_DIR>/<pid>.json; the metrics endpoint adds up every file.
+    # Totals of workers that have exited are folded into archive.json, so
+    # the counters stay monotonic while the pid files are removed.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.flushed = time.monotonic()
+        self.exit_pid = None
+
+    def new_entry(self):
+        return {
+            'requests': 0,
+            'buckets': [0] * (len(settings.METRICS_LATENCY_BUCKETS) + 1),
+            'duration': 0.0,
+            'queries': 0,
+            'sql_duration': 0.0,
+        }
+
+    def record(self, view, method, duration, tracker):
+        buckets = settings.METRICS_LATENCY_BUCKETS
+        index = next(
+            (number for number, bound in enumerate(buckets)
+             if duration <= bound), len(buckets))
+        with self.lock:
+            entry = self.totals.setdefault(
+                f'{view}|{method}', self.new_entry())
+            entry['requests'] += 1
+            entry['buckets'][index] += 1
+            entry['duration'] += duration
+            entry['queries'] += tracker.count
+            entry['sql_duration'] += tracker.duration
+            due = (time.monotonic() - self.flushed
+                   >= settings.METRICS_FLUSH_INTERVAL)
+        if due:
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('Не удалось сохранить метрики')
+
+    def path(self, pid):
+        return os.path.join(settings.METRICS_DIR, f'{pid}.json')
+
+    def flush(self):
+        if not settings.METRICS_DIR:
+            return
+        with self.lock:
+            data = json.dumps(self.totals)
+            self.flushed = time.monotonic()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        pid = os.getpid()
+        if self.exit_pid != pid:
+            # Registered in the worker itself, not in a master that forks.
+            atexit.register(self.exit)
+            self.exit_pid = pid
+        write_json(self.path(pid), data)
+
+    def exit(self):
+        if self.exit_pid != os.getpid():
+            return
+        try:
+            self.flush()
+            with directory_lock(settings.METRICS_DIR):
+                self.retire(self.path(os.getpid()))
+        except OSError:
+            logger.exception('Не удалось сохранить метрики')
+
+    def retire(self, path):
+        totals = read_json(path)
+        if totals is None:
+            return
+        archive = self.path(ARCHIVE_NAME)
+        merged = read_json(archive) or {}
+        self.merge(merged, totals)
+        write_json(archive, json.dumps(merged))
+        os.remove(path)
+
+    def expired(self, path):
+        # A worker killed before it could retire its own file.
+        # os.kill(pid, 0) only probes the process on POSIX systems.
+        pid = os.path.splitext(os.path.basename(path))[0]
+        if (os.name != 'posix' or not pid.isdigit()
+                or int(pid) == os.getpid()):
+            return False
+        try:
+            if (time.time() - os.path.getmtime(path)
+                    < settings.METRICS_FILE_TTL):
+                return False
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def merge(self, merged, totals):
+        for key, entry in totals.items():
+            target = merged.setdefault(key, self.new_entry())
+            if len(entry['buckets']) != len(target['buckets']):
+                continue
+            for field in ('requests', 'duration', 'queries',
+                          'sql_duration'):
+                target[field] += entry[field]
+            target['buckets'] = [
+                total + count for total, count
+                in zip(target['buckets'], entry['buckets'])]
+
+    def collect(self):
+        self.flush()
+        if not settings.METRICS_DIR:
+            with self.lock:
+                return copy.deepcopy(self.totals)
+        merged = {}
+        pattern = os.path.join(settings.METRICS_DIR, '*.json')
+        with directory_lock(settings.METRICS_DIR):
+            for path in glob.glob(pattern):
+                if self.expired(path):
+                    self.retire(path)
+            for path in glob.glob(pattern):
+                totals = read_json(path)
+                if totals is not None:
+                    self.merge(merged, totals)
+        return merged
+
+
+def read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+@contextmanager
+def directory_lock(directory):
+    # Serializes the read-modify-write of archive.json between workers.
+    with open(os.path.join(directory, LOCK_NAME), 'w') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        yield
+
+
+registry = Registry()
+
+
+def view_name(view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    return view_class.__name__
+
+
+def action_name(view_func, method):
+    actions = getattr(view_func, 'actions', None) or {}
+    return actions.get(method.lower())
+
+
+def resolved_view(view_func, method):
+    name = view_name(view_func)
+    action = action_name(view_func, method)
+    return f'{name}.{action}' if action else name
+
+
+def escape_label(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def render_prometheus(totals):
+    buckets = settings.METRICS_LATENCY_BUCKETS
+    requests = [
+        f'# HELP {METRIC_PREFIX}_requests_total Handled requests.',
+        f'# TYPE {METRIC_PREFIX}_requests_total counter',
+    ]
+    latency = [
+        f'# HELP {METRIC_PREFIX}_request_duration_seconds Request latency.',
+        f'# TYPE {METRIC_PREFIX}_request_duration_seconds histogram',
+    ]
+    queries = [
+        f'# HELP {METRIC_PREFIX}_sql_queries_total Executed SQL statements.',
+        f'# TYPE {METRIC_PREFIX}_sql_queries_total counter',
+    ]
+    sql_duration = [
+        f'# HELP {METRIC_PREFIX}_sql_duration_seconds_total '
+        'Time spent in SQL statements.',
+        f'# TYPE {METRIC_PREFIX}_sql_duration_seconds_total counter',
+    ]
+    for key in sorted(totals):
+        entry = totals[key]
+        view, method = key.rsplit('|', 1)
+        labels = f'view="{escape_label(view)}",method="{method}"'
+        requests.append(
+            f'{METRIC_PREFIX}_requests_total{{{labels}}} '
+            f'{entry["requests"]}')
+        cumulative = 0
+        for bound, count in zip((*buckets, '+Inf'), entry['buckets']):
+            cumulative += count
+            latency.append(
+                f'{METRIC_PREFIX}_request_duration_seconds_bucket'
+                f'{{{labels},le="{bound}"}} {cumulative}')
+        latency.append(
+            f'{METRIC_PREFIX}_request_duration_seconds_sum{{{labels}}} '
+            f'{entry["duration"]:.6f}')
+        latency.append(
+            f'{METRIC_PREFIX}_request_duration_seconds_count{{{labels}}} '
+            f'{entry["requests"]}')
+        queries.append(
+            f'{METRIC_PREFIX}_sql_queries_total{{{labels}}} '
+            f'{entry["queries"]}')
+        sql_duration.append(
+            f'{METRIC_PREFIX}_sql_duration_seconds_total{{{labels}}} '
+            f'{entry["sql_duration"]:.6f}')
+    return '\n'.join(requests + latency + queries + sql_duration) + '\n'
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics_view = UNRESOLVED_VIEW
+        tracker = QueryTracker()
+        started = time.perf_counter()
+        with connection.execute_wrapper(tracker):
+            response = self.get_response(request)
+        if response.streaming:
+            # The body is produced after the view returns; keep counting
+            # until the server has sent the last chunk.
+            response.streaming_content = self.stream(
+                request, response.streaming_content, tracker, started)
+        else:
+            self.record(request, started, tracker)
+        response['Server-Timing'] = (
+            f'db;dur={tracker.duration * 1000:.1f};'
+            f'desc="{tracker.count} SQL", '
+            f'app;dur={(time.perf_counter() - started) * 1000:.1f}')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = resolved_view(view_func, request.method)
+
+    def stream(self, request, content, tracker, started):
+        try:
+            with connection.execute_wrapper(tracker):
+                yield from content
+        finally:
+            self.record(request, started, tracker)
+
+    @staticmethod
+    def record(request, started, tracker):
+        registry.record(
+            request.metrics_view, request.method,
+            time.perf_counter() - started, tracker)
@@ -0,0 +1,160 @@
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .metrics import resolved_view
+
+logger = logging.getLogger(__name__)
+
+PROFILE_EXTENSION = '.folded'
+UNSAFE_NAME_RE = re.compile(r'[^\w.-]')
+
+
+@lru_cache(maxsize=None)
+def frame_label(code):
+    filename = code.co_filename
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        filename = os.path.relpath(filename, base_dir)
+    elif 'site-packages' in filename:
+        filename = filename.rsplit('site-packages' + os.sep, 1)[-1]
+    # ';' separates frames in the collapsed format.
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(
+        ';', ':')
+
+
+class StackSampler(threading.Thread):
+    # Samples the request thread's stack from a side thread, so the
+    # profiled code itself runs unmodified.
+
+    def __init__(self, thread_id, interval, roots):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.roots = roots
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = self.collapse(frame)
+            if not self.stopped.is_set():
+                self.stacks[stack] += 1
+
+    def collapse(self, frame):
+        labels = []
+        while frame is not None and frame.f_code not in self.roots:
+            labels.append(frame_label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.stacks
+
+
+class SampleRates:
+    # Rules edited in the admin override the settings; they are re-read
+    # at most every PROFILER_RULES_TTL seconds, not on every request.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rules = {}
+        self.loaded = None
+
+    def load(self):
+        from api.models import ProfilingRule
+        try:
+            return dict(ProfilingRule.objects.filter(
+                enabled=True).values_list('view', 'sample_rate'))
+        except DatabaseError:
+            logger.exception('Не удалось загрузить правила профилирования')
+            return {}
+
+    def get(self, view):
+        now = time.monotonic()
+        with self.lock:
+            expired = (self.loaded is None
+                       or now - self.loaded >= settings.PROFILER_RULES_TTL)
+            if expired:
+                self.loaded = now
+        if expired:
+            self.rules = self.load()
+        if view in self.rules:
+            return self.rules[view]
+        if settings.PROFILER_VIEWS and view not in settings.PROFILER_VIEWS:
+            return 0
+        return settings.PROFILER_SAMPLE_RATE
+
+
+sample_rates = SampleRates()
+
+
+def write_profile(view, stacks):
+    if not stacks:
+        return
+    os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+    name = '{}-{}-{}{}'.format(
+        int(time.time() * 1000), os.getpid(),
+        UNSAFE_NAME_RE.sub('_', view), PROFILE_EXTENSION)
+    with open(os.path.join(settings.PROFILER_DIR, name), 'w') as file:
+        for stack, count in stacks.items():
+            file.write(f'{view};{stack} {count}\n' if stack
+                       else f'{view} {count}\n')
+
+
+class ProfilerMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profiler = None
+        response = self.get_response(request)
+        if request.profiler is None:
+            return response
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response.streaming_content)
+        else:
+            self.finish(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.PROFILER_ENABLED:
+            return
+        view = resolved_view(view_func, request.method)
+        if random.random() >= sample_rates.get(view):
+            return
+        request.profiler_view = view
+        request.profiler = StackSampler(
+            threading.get_ident(), settings.PROFILER_INTERVAL,
+            {self.__call__.__code__, self.stream.__code__})
+        request.profiler.start()
+
+    def stream(self, request, content):
+        try:
+            yield from content
+        finally:
+            self.finish(request)
+
+    @staticmethod
+    def finish(request):
+        stacks = request.profiler.stop()
+        try:
+            write_profile(request.profiler_view, stacks)
+        except OSError:
+            logger.exception('Не удалось сохранить профиль запроса')
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_filters',
     'rest_framework',
     'rest_framework.authtoken',
@@ -58,6 +60,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
+    'foodgram.profiling.ProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -103,6 +107,67 @@ DATABASES = {
         }
     }
 
+# Version keys must be visible to every worker, host and management
+# command, so the default backend is the shared memcached service.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.memcached.PyMemcacheCache'),
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', default='memcached:11211'),
+    }
+}
+
+RECIPE_DOCUMENT_TIMEOUT = 60 * 60
+
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_TRIGRAM_THRESHOLD = 0.15
+INGREDIENT_FUZZY_CANDIDATES = 500
+
+if 'postgresql' in DATABASES['default']['ENGINE']:
+    # The pg_trgm % operator reads its threshold from the session.
+    DATABASES['default']['OPTIONS'] = {
+        'options': '-c pg_trgm.similarity_threshold='
+                   f'{INGREDIENT_TRIGRAM_THRESHOLD}',
+    }
+
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+RECIPE_IMAGE_RENDITIONS = {
+    'image_thumbnail': ('JPEG', (400, 400)),
+    'image_webp': ('WEBP', (1280, 1280)),
+}
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', default=2))
+MEDIA_GC_GRACE = 60 * 60
+
+FEED_MAX_ENTRIES = 500
+FEED_FANOUT_LIMIT = 1000
+
+TRENDING_WINDOW = 14 * 24 * 60 * 60
+TRENDING_HALF_LIFE = 48 * 60 * 60
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+METRICS_DIR = os.environ.get(
+    'METRICS_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-metrics'))
+METRICS_FLUSH_INTERVAL = 10
+METRICS_FILE_TTL = 60 * 60
+METRICS_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', default='0') == '1'
+PROFILER_SAMPLE_RATE = float(
+    os.environ.get('PROFILER_SAMPLE_RATE', default=0.01))
+PROFILER_VIEWS = tuple(
+    view for view in os.environ.get('PROFILER_VIEWS', default='').split(',')
+    if view)
+PROFILER_DIR = os.environ.get(
+    'PROFILER_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-profiles'))
+PROFILER_INTERVAL = 0.005
+PROFILER_RULES_TTL = 30
+
 AUTH_USER_MODEL = 'users.User'
 
 
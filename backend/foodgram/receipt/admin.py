@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.safestring import mark_safe
 
 from .forms import TagForm
+from .fulltext import search_recipes
 from .models import Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
 
 EMPTY = '-пусто-'
@@ -27,17 +28,19 @@ class RecipeTagInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('author', 'name', 'pub_date', 'pk')
+    list_display = ('author', 'name', 'pub_date', 'favorites_count',
+                    'in_carts_count', 'pk')
     search_fields = ('name', 'author', 'tags')
     list_filter = ('author', 'name', 'tags')
     filter_horizontal = ('tags',)
     empty_value_display = EMPTY
     inlines = (RecipeIngredientInline, RecipeTagInline)
-    readonly_fields = ('get_favorites_count',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
-    @admin.display(description='Общее число добавлений в избранное')
-    def get_favorites_count(self, obj):
-        return obj.favorites.count()
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_recipes(queryset, search_term), False
 
     def get_html_photo(self, object):
         return mark_safe(f'<img src="{object.image.url}" width=100>')
@@ -0,0 +1,51 @@
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Recipe
+from .storage import recipe_storage
+
+RECIPE_FILE_FIELDS = ('image', 'image_thumbnail', 'image_webp')
+RECIPE_UPLOAD_PREFIX = 'receipt'
+
+
+def recipe_file_names(recipe):
+    return [
+        getattr(recipe, field).name for field in RECIPE_FILE_FIELDS
+        if getattr(recipe, field)
+    ]
+
+
+def referenced_names(names):
+    query = Q()
+    for field in RECIPE_FILE_FIELDS:
+        query |= Q(**{f'{field}__in': names})
+    referenced = set()
+    for row in Recipe.objects.filter(query).values_list(*RECIPE_FILE_FIELDS):
+        referenced.update(row)
+    return referenced
+
+
+def release_files(names):
+    names = {name for name in names if name}
+    if not names:
+        return
+    referenced = referenced_names(names)
+    cutoff = timezone.now() - timedelta(seconds=settings.MEDIA_GC_GRACE)
+    for name in names - referenced:
+        try:
+            if recipe_storage.get_modified_time(name) > cutoff:
+                # Possibly just re-uploaded by another recipe; the garbage
+                # collector removes it later if it stays unreferenced.
+                continue
+            recipe_storage.delete(name)
+        except FileNotFoundError:
+            continue
+
+
+def release_files_on_commit(names):
+    transaction.on_commit(partial(release_files, list(names)))
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+RECIPE_VERSION_KEY = 'recipe:version:{}'
+RECIPE_DOCUMENT_KEY = 'recipe:document:v2:{}:{}'
+TABLE_VERSION_KEY = 'table:version:{}'
+USER_VERSION_KEY = 'user:version:{}'
+
+
+def new_version():
+    return time.time_ns()
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+def bump_versions(keys):
+    keys = list(set(keys))
+    if not keys:
+        return
+    # Drop the versions again once the transaction is visible to other
+    # connections, so a reader racing the commit cannot pin a stale document.
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_recipe_versions(recipe_ids):
+    keys = {RECIPE_VERSION_KEY.format(pk): pk for pk in recipe_ids}
+    versions = get_versions(keys)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_recipe_versions(recipe_ids):
+    keys = [RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids]
+    if keys:
+        bump_versions(keys + [TABLE_VERSION_KEY.format('recipes')])
+
+
+def bump_table_version(table):
+    bump_versions([TABLE_VERSION_KEY.format(table)])
+
+
+def bump_user_version(user_id):
+    bump_versions([USER_VERSION_KEY.format(user_id)])
+
+
+def get_recipe_documents(recipes, render):
+    versions = get_recipe_versions(recipe.pk for recipe in recipes)
+    keys = {
+        RECIPE_DOCUMENT_KEY.format(recipe.pk, versions[recipe.pk]): recipe
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys)
+    documents = {}
+    missing = {}
+    for key, recipe in keys.items():
+        if key in cached:
+            documents[recipe.pk] = cached[key]
+        else:
+            documents[recipe.pk] = missing[key] = render(recipe)
+    if missing:
+        cache.set_many(missing, timeout=settings.RECIPE_DOCUMENT_TIMEOUT)
+    return documents
+
+
+class CatalogueSnapshot:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def render(self, ids=None):
+        if ids is None:
+            ids = self.documents
+        return b'[' + b','.join(self.documents[pk] for pk in ids) + b']'
+
+
+class LocalCatalogue:
+    def __init__(self, table, build):
+        self.key = TABLE_VERSION_KEY.format(table)
+        self.build = build
+        self.lock = threading.Lock()
+        self.version = None
+        self.snapshot = None
+
+    def get(self, version=None):
+        if version is None:
+            version = get_versions([self.key])[self.key]
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.snapshot = self.build()
+                    self.version = version
+        return self.snapshot
@@ -0,0 +1,101 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import CartIngredientTotal, RecipeIngredient, ShoppingList
+
+TOLERANCE = 1e-9
+
+
+def recipe_deltas(user_ids, recipe_id, sign):
+    lines = RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values_list('ingredients_id', 'amount')
+    deltas = {}
+    for ingredient_id, amount in lines:
+        for user_id in user_ids:
+            deltas[(user_id, ingredient_id)] = (sign * amount, sign)
+    return deltas
+
+
+def cart_users(recipe_id):
+    return list(ShoppingList.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+
+
+def recipe_line_deltas(recipe_id, changes):
+    users = cart_users(recipe_id)
+    return {
+        (user_id, ingredient_id): change
+        for ingredient_id, change in changes.items()
+        for user_id in users
+    }
+
+
+def apply_deltas(deltas):
+    if not deltas:
+        return
+    user_ids = {user_id for user_id, ingredient_id in deltas}
+    ingredient_ids = {ingredient_id for user_id, ingredient_id in deltas}
+    try:
+        with transaction.atomic():
+            existing = CartIngredientTotal.objects.filter(
+                user_id__in=user_ids, ingredient_id__in=ingredient_ids)
+            changed = []
+            for row in existing:
+                delta = deltas.get((row.user_id, row.ingredient_id))
+                if delta is None:
+                    continue
+                row.total = F('total') + delta[0]
+                row.lines = F('lines') + delta[1]
+                changed.append(row)
+            CartIngredientTotal.objects.bulk_update(
+                changed, ('total', 'lines'))
+            known = {(row.user_id, row.ingredient_id) for row in changed}
+            CartIngredientTotal.objects.bulk_create([
+                CartIngredientTotal(user_id=user_id,
+                                    ingredient_id=ingredient_id,
+                                    total=total, lines=lines)
+                for (user_id, ingredient_id), (total, lines)
+                in deltas.items()
+                if (user_id, ingredient_id) not in known and lines > 0
+            ])
+            CartIngredientTotal.objects.filter(
+                user_id__in=user_ids, lines__lte=0).delete()
+    except IntegrityError:
+        # A concurrent request created the same row first.
+        reconcile_cart_totals(user_ids, ingredient_ids)
+
+
+def reconcile_cart_totals(user_ids, ingredient_ids=None):
+    expected_rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__user__in=user_ids)
+    actual_rows = CartIngredientTotal.objects.filter(user_id__in=user_ids)
+    if ingredient_ids is not None:
+        expected_rows = expected_rows.filter(ingredients_id__in=ingredient_ids)
+        actual_rows = actual_rows.filter(ingredient_id__in=ingredient_ids)
+    expected = {
+        (row['recipe__shopping_cart__user'], row['ingredients']):
+            (row['total'], row['lines'])
+        for row in expected_rows.values(
+            'recipe__shopping_cart__user', 'ingredients'
+        ).annotate(total=Sum('amount'), lines=Count('id')).order_by()
+    }
+    stale = []
+    changed = []
+    for row in actual_rows:
+        key = (row.user_id, row.ingredient_id)
+        if key not in expected:
+            stale.append(row.pk)
+            continue
+        total, lines = expected.pop(key)
+        if abs(row.total - total) > TOLERANCE or row.lines != lines:
+            row.total, row.lines = total, lines
+            changed.append(row)
+    with transaction.atomic():
+        CartIngredientTotal.objects.filter(pk__in=stale).delete()
+        CartIngredientTotal.objects.bulk_update(changed, ('total', 'lines'))
+        CartIngredientTotal.objects.bulk_create([
+            CartIngredientTotal(user_id=user_id, ingredient_id=ingredient_id,
+                                total=total, lines=lines)
+            for (user_id, ingredient_id), (total, lines) in expected.items()
+        ])
+    return len(stale) + len(changed) + len(expected)
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+UNSHARED_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    if settings.CACHES['default']['BACKEND'] not in UNSHARED_CACHES:
+        return []
+    return [Warning(
+        'Кэш по умолчанию не общий для процессов и серверов.',
+        hint='Версии рецептов и справочников, сброшенные management-'
+             'командами или другими воркерами, не дойдут до этого '
+             'процесса, а файловый кэш перебирает весь каталог при каждой '
+             'записи. Такие кэши годятся только для разработки; укажите '
+             'CACHE_BACKEND с общим хранилищем, например memcached.',
+        id='receipt.W001',
+    )]
@@ -0,0 +1,29 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Subscribe, User
+
+from .models import Favorite, Recipe, ShoppingList
+
+COUNTERS = {
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingList: (Recipe, 'recipe_id', 'in_carts_count'),
+    Subscribe: (User, 'author_id', 'followers_count'),
+}
+
+
+def shift_counter(instance, delta):
+    model, attname, field = COUNTERS[type(instance)]
+    model.objects.filter(pk=getattr(instance, attname)).update(
+        **{field: Greatest(F(field) + delta, Value(0))})
+
+
+def recount(source):
+    model, attname, field = COUNTERS[source]
+    relation = source._meta.get_field(attname).name
+    actual = Coalesce(Subquery(
+        source.objects.filter(**{relation: OuterRef('pk')}).order_by(
+        ).values(relation).annotate(total=Count('pk')).values('total')
+    ), 0)
+    return model.objects.exclude(**{field: actual}).update(**{field: actual})
@@ -0,0 +1,138 @@
+import csv
+
+from pytils.translit import translify
+
+TITLE = 'Cписок покупок:'
+
+
+def format_line(number, ingredient):
+    return (f'{number} {ingredient["name"]} - {ingredient["total"]} '
+            f'{ingredient["measurement_unit"]}')
+
+
+class TextRenderer:
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def render(self, ingredients):
+        yield f'{TITLE}\n'
+        for number, ingredient in enumerate(ingredients, start=1):
+            yield f'{format_line(number, ingredient)}\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class CSVRenderer:
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+    header = ('№', 'Ингредиент', 'Количество', 'Единица измерения')
+
+    def render(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for number, ingredient in enumerate(ingredients, start=1):
+            yield writer.writerow((
+                number,
+                ingredient['name'],
+                ingredient['total'],
+                ingredient['measurement_unit'],
+            ))
+
+
+class PDFRenderer:
+    # Hand-written PDF using the built-in Helvetica font, so no font file
+    # or extra dependency is needed; Cyrillic text is transliterated.
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    lines_per_page = 48
+    page_size = (595, 842)
+    font_size = 12
+    leading = 16
+    margin = 50
+
+    def render(self, ingredients):
+        self.offsets = {}
+        self.position = 0
+        self.next_number = 4
+        yield self.write(b'%PDF-1.4\n')
+        yield self.write_object(3, (
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            b'/Encoding /WinAnsiEncoding >>'))
+        pages = []
+        for lines in self.paginate(ingredients):
+            content = self.page_content(lines)
+            contents = self.allocate()
+            yield self.write_object(contents, (
+                b'<< /Length %d >>\nstream\n' % len(content)
+                + content + b'\nendstream'))
+            page = self.allocate()
+            yield self.write_object(page, (
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                b'/Resources << /Font << /F1 3 0 R >> >> '
+                b'/Contents %d 0 R >>' % (*self.page_size, contents)))
+            pages.append(page)
+        kids = b' '.join(b'%d 0 R' % page for page in pages)
+        yield self.write_object(2, (
+            b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(pages))))
+        yield self.write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        yield self.write_trailer()
+
+    def paginate(self, ingredients):
+        lines = [TITLE]
+        for number, ingredient in enumerate(ingredients, start=1):
+            lines.append(format_line(number, ingredient))
+            if len(lines) == self.lines_per_page:
+                yield lines
+                lines = []
+        if lines:
+            yield lines
+
+    def page_content(self, lines):
+        top = self.page_size[1] - self.margin
+        commands = [
+            b'BT /F1 %d Tf %d TL %d %d Td' % (
+                self.font_size, self.leading, self.margin, top)]
+        for line in lines:
+            commands.append(b'(%s) Tj T*' % self.escape(line))
+        commands.append(b'ET')
+        return b'\n'.join(commands)
+
+    @staticmethod
+    def escape(line):
+        text = translify(line, strict=False)
+        text = text.encode('cp1252', 'replace')
+        return (text.replace(b'\\', b'\\\\')
+                .replace(b'(', b'\\(').replace(b')', b'\\)'))
+
+    def allocate(self):
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def write(self, data):
+        self.position += len(data)
+        return data
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.position
+        return self.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def write_trailer(self):
+        size = max(self.offsets) + 1
+        entries = [b'0000000000 65535 f \n']
+        entries.extend(
+            b'%010d 00000 n \n' % self.offsets[number]
+            for number in range(1, size))
+        return (
+            b'xref\n0 %d\n' % size + b''.join(entries)
+            + b'trailer\n<< /Size %d /Root 1 0 R >>\n' % size
+            + b'startxref\n%d\n%%%%EOF\n' % self.position)
+
+
+SHOPPING_LIST_RENDERERS = {
+    renderer.extension: renderer
+    for renderer in (TextRenderer, CSVRenderer, PDFRenderer)
+}
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.db.models import Count, F, Q, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from users.models import Subscribe
+
+from .models import FeedEntry, Recipe
+
+
+def follower_ids(author_id):
+    # One row more than the limit is enough to tell a fan-out author
+    # from one whose followers read the recipes directly.
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(Subscribe.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)[:limit + 1])
+    return None if len(followers) > limit else followers
+
+
+def trim_timelines(user_ids):
+    cap = settings.FEED_MAX_ENTRIES
+    overflowing = FeedEntry.objects.filter(user_id__in=user_ids).values(
+        'user_id').annotate(entries=Count('id')).filter(
+        entries__gt=cap).values_list('user_id', flat=True)
+    overflowing = list(overflowing)
+    if not overflowing:
+        return
+    ranked = FeedEntry.objects.filter(user_id__in=overflowing).annotate(
+        entry_rank=Window(
+            RowNumber(), partition_by=F('user'),
+            order_by=(F('pub_date').desc(), F('recipe_id').desc()),
+        )).values('id', 'entry_rank')
+    sql, params = ranked.query.sql_with_params()
+    FeedEntry.objects.filter(pk__in=RawSQL(
+        f'SELECT id FROM ({sql}) ranked WHERE entry_rank > %s',
+        (*params, cap),
+    )).delete()
+
+
+def push_recipe(recipe):
+    # Timelines are trimmed to FEED_MAX_ENTRIES by the trim_feeds command,
+    # not on every publish.
+    followers = follower_ids(recipe.author_id)
+    if not followers:
+        return
+    FeedEntry.objects.bulk_create([
+        FeedEntry(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+        for user_id in followers
+    ], ignore_conflicts=True)
+
+
+def fill_timelines(user_ids, author_id):
+    recipes = list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list(
+        'id', 'pub_date')[:settings.FEED_MAX_ENTRIES])
+    FeedEntry.objects.bulk_create([
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+        for user_id in user_ids
+        for recipe_id, pub_date in recipes
+    ], ignore_conflicts=True)
+    trim_timelines(user_ids)
+
+
+def backfill_timeline(user_id, author_id):
+    if follower_ids(author_id) is None:
+        return
+    fill_timelines([user_id], author_id)
+
+
+def prune_timeline(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+    # An author who drops back to the fan-out limit is no longer pulled;
+    # the recipes published meanwhile are pushed to the followers left.
+    followers = follower_ids(author_id)
+    if followers and len(followers) == settings.FEED_FANOUT_LIMIT:
+        fill_timelines(followers, author_id)
+
+
+def trim_all_timelines(batch_size):
+    user_ids = FeedEntry.objects.order_by('user_id').values_list(
+        'user_id', flat=True).distinct()
+    last = 0
+    while True:
+        batch = list(user_ids.filter(user_id__gt=last)[:batch_size])
+        if not batch:
+            return
+        trim_timelines(batch)
+        last = batch[-1]
+
+
+def pulled_authors(user):
+    return list(Subscribe.objects.filter(
+        user=user, author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values_list('author_id', flat=True))
+
+
+def after(position, date_field, id_field):
+    if position is None:
+        return Q()
+    pub_date, pk = position
+    return (Q(**{f'{date_field}__lt': pub_date})
+            | Q(**{date_field: pub_date, f'{id_field}__lt': pk}))
+
+
+def feed_recipes(user, position, limit):
+    # The page is cut from the user's timeline on its own index; recipes
+    # of pulled authors are merged in, and only the page is joined.
+    keys = list(FeedEntry.objects.filter(
+        after(position, 'pub_date', 'recipe_id'), user=user,
+    ).order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id')[:limit])
+    authors = pulled_authors(user)
+    if authors:
+        keys = sorted(set(keys).union(Recipe.objects.filter(
+            after(position, 'pub_date', 'id'), author_id__in=authors,
+        ).order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id')[:limit]), reverse=True)[:limit]
+    ids = [recipe_id for pub_date, recipe_id in keys]
+    recipes = Recipe.objects.with_related().annotate_user_flags(
+        user).in_bulk(ids)
+    return [recipes[pk] for pk in ids if pk in recipes]
@@ -1,5 +1,6 @@
 from django_filters.rest_framework import FilterSet, filters
 
+from .fulltext import search_recipes
 from .models import Recipe, Tag
 
 
@@ -13,17 +14,34 @@ class RecipeFilter(FilterSet):
         label='Tags',
         to_field_name="slug",
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        method='get_ordering',
+        choices=(('trending', 'trending'), ('popular', 'popular')))
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
 
     def get_is_favorited(self, queryset, name, value):
         if value:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        if value == 'popular':
+            # Matches recipe_favorites_count_id_idx.
+            return queryset.order_by('-favorites_count', '-id')
+        # Only recipes with recent activity have a score; the ordering
+        # matches recipe_score_idx, so the ranking is read off the index.
+        return queryset.filter(score__isnull=False).order_by(
+            '-score__score', '-id')
@@ -0,0 +1,90 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe, RecipeIngredient
+
+FTS_TABLE = 'receipt_recipe_fts'
+FTS_INSERT = '''
+    INSERT INTO {table} (rowid, name, text, ingredients)
+    SELECT recipe.id, recipe.name, recipe.text, (
+        SELECT group_concat(ingredient.name, ' ')
+        FROM receipt_recipeingredient line
+        JOIN receipt_ingredient ingredient
+            ON ingredient.id = line.ingredients_id
+        WHERE line.recipe_id = recipe.id
+    )
+    FROM receipt_recipe recipe
+    WHERE recipe.id IN ({placeholders})
+'''
+
+
+def search_document():
+    ingredient_names = Subquery(
+        RecipeIngredient.objects.filter(recipe=OuterRef('pk')).order_by(
+        ).values('recipe').annotate(
+            names=StringAgg('ingredients__name', ' ')
+        ).values('names'))
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)
+            + SearchVector(ingredient_names, weight='C', config=config))
+
+
+def refresh_search_index(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=search_document())
+    elif connection.vendor == 'sqlite':
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                recipe_ids)
+            cursor.execute(FTS_INSERT.format(
+                table=FTS_TABLE, placeholders=placeholders), recipe_ids)
+
+
+def schedule_search_refresh(recipe_ids):
+    # Deferred to commit, so a recipe created together with its
+    # ingredients is indexed once they are all written.
+    transaction.on_commit(
+        partial(refresh_search_index, list(recipe_ids)))
+
+
+def match_expression(value):
+    # Every word is quoted, so user input never reaches the FTS5 query
+    # syntax; the words are matched with an implicit AND.
+    return ' '.join(
+        '"{}"'.format(word.replace('"', '""')) for word in value.split())
+
+
+def search_recipes(queryset, value):
+    value = value.strip()
+    if not value:
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, config=settings.RECIPE_SEARCH_CONFIG,
+                            search_type='websearch')
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query))
+    else:
+        match = match_expression(value)
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -rank FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = receipt_recipe.id',
+            (match,), output_field=FloatField(),
+        ))
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
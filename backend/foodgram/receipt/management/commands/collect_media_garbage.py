@@ -0,0 +1,87 @@
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from receipt.blobs import RECIPE_FILE_FIELDS, RECIPE_UPLOAD_PREFIX
+from receipt.cache import bump_recipe_versions
+from receipt.models import Recipe
+from receipt.storage import recipe_storage
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из каталога загрузок рецептов файлы, на которые '
+            'не ссылается ни одна запись.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько файлов будет удалено.')
+        parser.add_argument(
+            '--grace', type=int, default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы моложе указанного числа секунд.')
+        parser.add_argument(
+            '--rehash', action='store_true',
+            help='Сначала перенести старые изображения рецептов '
+                 'под имена по содержимому.')
+
+    def handle(self, *args, **options):
+        if options['rehash']:
+            self.rehash()
+        referenced = self.referenced_names()
+        cutoff = time.time() - options['grace']
+        removed = freed = 0
+        # Only the upload prefix is walked: anything else under MEDIA_ROOT
+        # is not managed by the storage and must not be deleted.
+        for root, dirs, files in os.walk(
+                recipe_storage.path(RECIPE_UPLOAD_PREFIX)):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(
+                    path, recipe_storage.location).replace(os.sep, '/')
+                if name in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                freed += os.path.getsize(path)
+                removed += 1
+                if not options['dry_run']:
+                    os.remove(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {removed}, освобождено: {freed} байт.'))
+
+    @staticmethod
+    def referenced_names():
+        referenced = set()
+        for model in apps.get_models():
+            fields = [
+                field.attname for field in model._meta.concrete_fields
+                if isinstance(field, models.FileField)
+            ]
+            if not fields:
+                continue
+            for row in model._default_manager.values_list(
+                    *fields).iterator():
+                referenced.update(row)
+        return referenced
+
+    def rehash(self):
+        moved = 0
+        recipes = Recipe.objects.only('pk', *RECIPE_FILE_FIELDS)
+        for recipe in recipes.iterator():
+            changes = {}
+            for field in RECIPE_FILE_FIELDS:
+                name = getattr(recipe, field).name
+                if not name or recipe_storage.is_hashed(name):
+                    continue
+                try:
+                    with recipe_storage.open(name) as content:
+                        changes[field] = recipe_storage.save(name, content)
+                except FileNotFoundError:
+                    self.stderr.write(f'Файл не найден: {name}')
+            if changes:
+                Recipe.objects.filter(pk=recipe.pk).update(**changes)
+                bump_recipe_versions([recipe.pk])
+                moved += len(changes)
+        self.stdout.write(f'Перенесено файлов: {moved}.')
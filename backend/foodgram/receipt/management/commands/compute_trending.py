@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from receipt.trending import compute_trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярных рецептов по недавним '
+            'добавлениям в избранное и списки покупок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        scored = compute_trending(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан, рецептов в рейтинге: {scored}.'))
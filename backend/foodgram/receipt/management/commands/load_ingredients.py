@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from receipt.cache import bump_table_version
+from receipt.models import Ingredient
+
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+JSON_BLOCK_SIZE = 1 << 16
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    opened = False
+    while True:
+        block = file.read(JSON_BLOCK_SIZE)
+        buffer += block
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not opened:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив ингредиентов.')
+                opened = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+        if not block:
+            raise CommandError('Неожиданный конец JSON-файла.')
+
+
+def chunked(rows, size):
+    chunk = {}
+    for name, measurement_unit in rows:
+        name, measurement_unit = name.strip(), measurement_unit.strip()
+        if not name or not measurement_unit:
+            continue
+        chunk[(name, measurement_unit)] = None
+        if len(chunk) >= size:
+            yield list(chunk)
+            chunk = {}
+    if chunk:
+        yield list(chunk)
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV- или JSON-файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='Формат файла; по умолчанию определяется по расширению.')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path)[1].lstrip('.').lower()
+        readers = {'csv': read_csv, 'json': read_json}
+        if file_format not in readers:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
+        write = self.copy_chunk if use_copy else self.insert_chunk
+        before = Ingredient.objects.count()
+        rows = 0
+        started = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                for chunk in chunked(readers[file_format](file),
+                                     options['chunk_size']):
+                    with transaction.atomic():
+                        write(chunk)
+                    rows += len(chunk)
+        except OSError as error:
+            raise CommandError(error)
+        finally:
+            bump_table_version('ingredients')
+        elapsed = time.perf_counter() - started
+        created = Ingredient.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {rows}, добавлено: {created}, '
+            f'{rows / elapsed if elapsed else rows:.0f} строк/с.'))
+
+    @staticmethod
+    def insert_chunk(chunk):
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in chunk],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def copy_chunk(chunk):
+        table = Ingredient._meta.db_table
+        data = io.StringIO()
+        csv.writer(data).writerows(chunk)
+        data.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredient_staging '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DELETE ROWS'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                data,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_staging '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from receipt.carts import reconcile_cart_totals
+from receipt.models import CartIngredientTotal, ShoppingList
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги списков покупок и исправляет расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(ShoppingList.objects.values_list('user_id', flat=True))
+            | set(CartIngredientTotal.objects.values_list(
+                'user_id', flat=True))
+        )
+        batch_size = options['batch_size']
+        fixed = 0
+        for start in range(0, len(user_ids), batch_size):
+            fixed += reconcile_cart_totals(
+                user_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(user_ids)}, исправлено строк: {fixed}.'))
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from receipt.models import Recipe
+from receipt.renditions import render_now
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры и WebP-версии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать версии для всех рецептов.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            missing = Q()
+            for field in settings.RECIPE_IMAGE_RENDITIONS:
+                missing |= Q(**{field: ''})
+            recipes = recipes.filter(missing)
+        count = 0
+        for pk, name in recipes.values_list('pk', 'image').iterator():
+            try:
+                failed = render_now(pk, name)
+            except OSError as error:
+                self.stderr.write(f'Рецепт {pk}: {error}')
+                continue
+            for field in failed:
+                self.stderr.write(f'Рецепт {pk}: не удалось подготовить '
+                                  f'{field}')
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {count}.'))
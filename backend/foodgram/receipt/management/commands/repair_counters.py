@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from receipt.counters import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, покупок, рецептов '
+            'и подписчиков.')
+
+    def handle(self, *args, **options):
+        for source, (model, attname, field) in COUNTERS.items():
+            fixed = recount(source)
+            self.stdout.write(
+                f'{model._meta.label}.{field}: исправлено {fixed}.')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
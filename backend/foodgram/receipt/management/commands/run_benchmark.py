@@ -0,0 +1,184 @@
+import json
+import math
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from receipt.models import Ingredient
+from users.models import User
+
+from .seed_benchmark_data import USERNAME_PREFIX
+
+ENDPOINTS = {
+    'recipes': '/api/recipes/',
+    'download_shopping_cart': '/api/recipes/download_shopping_cart/',
+    'subscriptions': '/api/users/subscriptions/',
+    'ingredients': '/api/ingredients/?name={ingredient_prefix}',
+}
+
+
+class QueryCounter:
+    # Counted through an execute wrapper: the test client resets
+    # connection.queries at the start of every request.
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(timings, number):
+    index = max(0, math.ceil(number / 100 * len(timings)) - 1)
+    return round(timings[index], 3)
+
+
+def summarize(timings, elapsed):
+    timings = sorted(timings)
+    return {
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'throughput_rps': round(len(timings) / elapsed, 1),
+    }
+
+
+def consume(response):
+    if response.streaming:
+        for chunk in response.streaming_content:
+            pass
+    return response.status_code
+
+
+class Command(BaseCommand):
+    help = ('Измеряет задержку, пропускную способность и число SQL-запросов '
+            'основных эндпоинтов через тестовый клиент Django.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--endpoint', action='append', choices=tuple(ENDPOINTS),
+            help='Измерить только указанные эндпоинты.')
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого '
+                           'выполняются запросы.')
+        parser.add_argument('--output', help='Файл для сохранения JSON.')
+        parser.add_argument('--baseline', help='JSON предыдущего прогона.')
+        parser.add_argument(
+            '--tolerance', type=float, default=10.0,
+            help='Допустимый рост p95 в процентах относительно baseline.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('Нужен хотя бы один запрос на эндпоинт.')
+        setup_test_environment()
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        context = {'ingredient_prefix': self.ingredient_prefix()}
+        results = {}
+        for name in options['endpoint'] or ENDPOINTS:
+            path = ENDPOINTS[name].format(**context)
+            results[name] = self.measure(
+                client, path, options['requests'], options['warmup'])
+            self.stdout.write(self.format_result(name, results[name]))
+        report = {
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'user': user.email,
+            'requests': options['requests'],
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def get_user(self, email):
+        if email:
+            try:
+                return User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {email} не найден.')
+        # The busiest seeded user: most subscriptions, then the largest
+        # shopping cart, so every endpoint has something to return.
+        user = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).annotate(
+            subscriptions=Count('subscribers', distinct=True),
+            cart=Count('shopping_cart', distinct=True),
+        ).order_by('-subscriptions', '-cart').first()
+        if user is None:
+            raise CommandError(
+                'Нет данных для тестирования; запустите seed_benchmark_data '
+                'или укажите --user.')
+        return user
+
+    @staticmethod
+    def ingredient_prefix():
+        name = Ingredient.objects.order_by('name').values_list(
+            'name', flat=True).first()
+        return (name or 'а')[:2]
+
+    @staticmethod
+    def measure(client, path, requests, warmup):
+        for _ in range(warmup):
+            consume(client.get(path))
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            status = consume(client.get(path))
+        timings = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            request_started = time.perf_counter()
+            consume(client.get(path))
+            timings.append((time.perf_counter() - request_started) * 1000)
+        elapsed = time.perf_counter() - started
+        return {
+            'path': path,
+            'status': status,
+            'queries': counter.count,
+            **summarize(timings, elapsed),
+        }
+
+    @staticmethod
+    def format_result(name, result):
+        return (
+            f'{name}: {result["status"]}, запросов SQL: '
+            f'{result["queries"]}, p50 {result["p50_ms"]} мс, '
+            f'p95 {result["p95_ms"]} мс, p99 {result["p99_ms"]} мс, '
+            f'{result["throughput_rps"]} запр./с'
+        )
+
+    def compare(self, results, path, tolerance):
+        try:
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)['endpoints']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать baseline: {error}')
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            change = (result['p95_ms'] / previous['p95_ms'] - 1) * 100
+            queries = result['queries'] - previous['queries']
+            self.stdout.write(
+                f'{name}: p95 {change:+.1f}%, запросов SQL {queries:+d}')
+            if change > tolerance or queries > 0:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(
+                'Регрессия относительно baseline: ' + ', '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено.'))
@@ -0,0 +1,274 @@
+import heapq
+import io
+import itertools
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from receipt.cache import bump_table_version
+from receipt.carts import reconcile_cart_totals
+from receipt.counters import COUNTERS, recount
+from receipt.fulltext import refresh_search_index
+from receipt.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, ShoppingList, Tag)
+from receipt.trending import compute_trending
+from users.models import Subscribe, User
+
+from .load_ingredients import DEFAULT_PATH, chunked, read_csv
+
+USERNAME_PREFIX = 'benchmark_'
+PASSWORD = 'benchmark'
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2C94C', 'dessert'),
+    ('Выпечка', '#B5651D', 'baking'),
+    ('Суп', '#2D9CDB', 'soup'),
+)
+MEASUREMENT_AMOUNTS = {'г': (10, 500), 'мл': (10, 1000), 'шт.': (1, 6)}
+
+
+def popularity(count, rng):
+    # Zipf-like weights over a shuffled order: a few recipes and authors
+    # collect most of the favorites and followers, as in production.
+    ranks = list(range(count))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(1 / (rank + 1) for rank in ranks))
+
+
+def pick(rng, population, cum_weights, count):
+    count = min(count, len(population))
+    chosen = set()
+    for _ in range(4):
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=count - len(chosen)))
+        if len(chosen) >= count:
+            break
+    return chosen
+
+
+def spread(rng, average):
+    return max(1, round(rng.gauss(average, average / 3)))
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетических пользователей, рецепты, избранное, '
+            'списки покупок и подписки для нагрузочного тестирования.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--authors', type=float, default=0.2,
+            help='Доля пользователей, публикующих рецепты.')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=4)
+        parser.add_argument('--subscriptions-per-user', type=int, default=10)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--ingredients-path', default=DEFAULT_PATH)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить ранее созданные данные перед генерацией.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        benchmark_users = User.objects.filter(
+            username__startswith=USERNAME_PREFIX)
+        if benchmark_users.exists():
+            if not options['clear']:
+                raise CommandError(
+                    'Данные для нагрузочного тестирования уже созданы; '
+                    'используйте --clear, чтобы пересоздать их.')
+            benchmark_users.delete()
+        ingredients = self.load_ingredients(options['ingredients_path'])
+        tags = self.create_tags()
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            authors = users[:max(1, int(len(users) * options['authors']))]
+            recipes = self.create_recipes(
+                authors, options['recipes'], options['days'])
+            self.create_recipe_lines(
+                recipes, ingredients, tags,
+                options['ingredients_per_recipe'])
+            subscriptions = self.create_subscriptions(
+                users, authors, options['subscriptions_per_user'])
+            self.create_user_recipes(
+                Favorite, users, recipes, options['favorites_per_user'])
+            self.create_user_recipes(
+                ShoppingList, users, recipes, options['cart_per_user'])
+            self.create_timelines(recipes, subscriptions)
+        self.refresh_derived_data(users, recipes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, авторов: {len(authors)}, '
+            f'рецептов: {len(recipes)}, подписок: {len(subscriptions)}.'))
+
+    def load_ingredients(self, path):
+        if not Ingredient.objects.exists():
+            try:
+                with open(path, encoding='utf-8', newline='') as file:
+                    for chunk in chunked(read_csv(file), self.batch_size):
+                        Ingredient.objects.bulk_create(
+                            [Ingredient(name=name, measurement_unit=unit)
+                             for name, unit in chunk],
+                            ignore_conflicts=True,
+                        )
+            except OSError as error:
+                raise CommandError(error)
+            bump_table_version('ingredients')
+        return list(Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'))
+
+    def create_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            )
+            bump_table_version('tags')
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        User.objects.bulk_create((
+            User(username=f'{USERNAME_PREFIX}{number}',
+                 email=f'{USERNAME_PREFIX}{number}@example.com',
+                 first_name='Тест', last_name=f'Пользователь {number}',
+                 password=password)
+            for number in range(count)
+        ), batch_size=self.batch_size)
+        return list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_image(self):
+        image = Image.new('RGB', (640, 480), (230, 160, 90))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        field = Recipe._meta.get_field('image')
+        return field.storage.save(
+            field.generate_filename(None, 'benchmark.png'),
+            ContentFile(buffer.getvalue()))
+
+    def create_recipes(self, authors, count, days):
+        rng = self.rng
+        weights = popularity(len(authors), rng)
+        image = self.create_image()
+        Recipe.objects.bulk_create((
+            Recipe(author_id=author_id, name='', text='', image=image,
+                   cooking_time=rng.randint(5, 180))
+            for author_id in rng.choices(
+                authors, cum_weights=weights, k=count)
+        ), batch_size=self.batch_size)
+        recipes = list(Recipe.objects.filter(
+            author__username__startswith=USERNAME_PREFIX).order_by('id'))
+        now = timezone.now()
+        for recipe in recipes:
+            # pub_date is auto_now_add, so the spread is written afterwards.
+            recipe.pub_date = now - timedelta(
+                seconds=rng.randint(0, days * 24 * 60 * 60))
+        Recipe.objects.bulk_update(
+            recipes, ('pub_date',), batch_size=self.batch_size)
+        return recipes
+
+    def create_recipe_lines(self, recipes, ingredients, tags, average):
+        rng = self.rng
+        weights = popularity(len(ingredients), rng)
+        lines = []
+        recipe_tags = []
+        updated = []
+        for recipe in recipes:
+            chosen = sorted(
+                pick(rng, ingredients, weights, spread(rng, average)))
+            for ingredient_id, name, unit in chosen:
+                low, high = MEASUREMENT_AMOUNTS.get(unit, (1, 10))
+                lines.append(RecipeIngredient(
+                    recipe_id=recipe.pk, ingredients_id=ingredient_id,
+                    amount=rng.randint(low, high)))
+            names = [name for ingredient_id, name, unit in chosen]
+            recipe.name = f'{names[0].capitalize()} №{recipe.pk}'
+            recipe.text = 'Смешать: ' + ', '.join(names) + '.'
+            updated.append(recipe)
+            tag_count = rng.randint(1, min(3, len(tags)))
+            recipe_tags.extend(
+                RecipeTag(recipe_id=recipe.pk, tag_id=tag_id)
+                for tag_id in rng.sample(tags, tag_count)
+            )
+        RecipeIngredient.objects.bulk_create(
+            lines, batch_size=self.batch_size)
+        RecipeTag.objects.bulk_create(recipe_tags, batch_size=self.batch_size)
+        Recipe.objects.bulk_update(
+            updated, ('name', 'text'), batch_size=self.batch_size)
+
+    def create_subscriptions(self, users, authors, average):
+        rng = self.rng
+        weights = popularity(len(authors), rng)
+        subscriptions = []
+        for user_id in users:
+            chosen = pick(rng, authors, weights, spread(rng, average))
+            subscriptions.extend(
+                (user_id, author_id) for author_id in chosen
+                if author_id != user_id)
+        Subscribe.objects.bulk_create((
+            Subscribe(user_id=user_id, author_id=author_id)
+            for user_id, author_id in subscriptions
+        ), batch_size=self.batch_size)
+        return subscriptions
+
+    def create_user_recipes(self, model, users, recipes, average):
+        rng = self.rng
+        recipe_ids = [recipe.pk for recipe in recipes]
+        weights = popularity(len(recipe_ids), rng)
+        model.objects.bulk_create((
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in users
+            for recipe_id in pick(
+                rng, recipe_ids, weights, spread(rng, average))
+        ), batch_size=self.batch_size)
+
+    def create_timelines(self, recipes, subscriptions):
+        # Bulk inserts skip the signals that fan recipes out to followers,
+        # so the timelines are built here the same way push_recipe would.
+        by_author = {}
+        for recipe in recipes:
+            by_author.setdefault(recipe.author_id, []).append(
+                (recipe.pub_date, recipe.pk))
+        followers = {}
+        for user_id, author_id in subscriptions:
+            followers.setdefault(author_id, []).append(user_id)
+        timelines = {}
+        for author_id, user_ids in followers.items():
+            if len(user_ids) > settings.FEED_FANOUT_LIMIT:
+                continue
+            for user_id in user_ids:
+                timelines.setdefault(user_id, []).extend(
+                    by_author.get(author_id, ()))
+        FeedEntry.objects.bulk_create((
+            FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+            for user_id, entries in timelines.items()
+            for pub_date, recipe_id in heapq.nlargest(
+                settings.FEED_MAX_ENTRIES, entries)
+        ), batch_size=self.batch_size)
+
+    def refresh_derived_data(self, users, recipes):
+        for source in COUNTERS:
+            recount(source)
+        for start in range(0, len(users), self.batch_size):
+            reconcile_cart_totals(users[start:start + self.batch_size])
+        recipe_ids = [recipe.pk for recipe in recipes]
+        for start in range(0, len(recipe_ids), self.batch_size):
+            refresh_search_index(recipe_ids[start:start + self.batch_size])
+        compute_trending(self.batch_size)
+        bump_table_version('recipes')
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from receipt.feed import trim_all_timelines
+
+
+class Command(BaseCommand):
+    help = ('Обрезает ленты подписок до FEED_MAX_ENTRIES последних '
+            'рецептов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        trim_all_timelines(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты обрезаны до {settings.FEED_MAX_ENTRIES} записей.'))
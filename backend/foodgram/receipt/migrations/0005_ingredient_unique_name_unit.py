@@ -0,0 +1,44 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:17
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('receipt', 'Ingredient')
+    RecipeIngredient = apps.get_model('receipt', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        keep = group['keep']
+        extra = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=keep)
+        for line in RecipeIngredient.objects.filter(ingredients__in=extra):
+            kept = RecipeIngredient.objects.filter(
+                recipe_id=line.recipe_id, ingredients_id=keep).first()
+            if kept is None:
+                line.ingredients_id = keep
+                line.save(update_fields=['ingredients'])
+            else:
+                kept.amount += line.amount
+                kept.save(update_fields=['amount'])
+                line.delete()
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt', '0004_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:28
+
+from django.db import migrations, models
+import receipt.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt', '0007_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Добавьте изображение', storage=receipt.storage.ContentAddressedStorage(), upload_to='receipt/images/', verbose_name='Загрузить фото'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, storage=receipt.storage.ContentAddressedStorage(), upload_to='receipt/thumbnails/', verbose_name='Миниатюра'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_webp',
+            field=models.ImageField(blank=True, editable=False, storage=receipt.storage.ContentAddressedStorage(), upload_to='receipt/webp/', verbose_name='Изображение WebP'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_timelines(apps, schema_editor):
+    Subscribe = apps.get_model('users', 'Subscribe')
+    Recipe = apps.get_model('receipt', 'Recipe')
+    FeedEntry = apps.get_model('receipt', 'FeedEntry')
+    fanout_authors = Subscribe.objects.values('author_id').annotate(
+        followers=Count('id')
+    ).filter(
+        followers__lte=settings.FEED_FANOUT_LIMIT
+    ).values_list('author_id', flat=True)
+    follows = {}
+    for user_id, author_id in Subscribe.objects.filter(
+            author_id__in=fanout_authors).values_list('user_id', 'author_id'):
+        follows.setdefault(user_id, []).append(author_id)
+    for user_id, author_ids in follows.items():
+        recipes = Recipe.objects.filter(author_id__in=author_ids).order_by(
+            '-pub_date', '-id').values_list('id', 'pub_date')
+        FeedEntry.objects.bulk_create([
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes[:settings.FEED_MAX_ENTRIES]
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('receipt', '0008_recipe_content_addressed_storage'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='receipt.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
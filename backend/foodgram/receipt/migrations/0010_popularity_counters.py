@@ -0,0 +1,45 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('receipt', 'Recipe', 'users', 'User', 'author', 'recipes_count'),
+    ('receipt', 'Favorite', 'receipt', 'Recipe', 'recipe', 'favorites_count'),
+    ('receipt', 'ShoppingList', 'receipt', 'Recipe', 'recipe',
+     'in_carts_count'),
+    ('users', 'Subscribe', 'users', 'User', 'author', 'followers_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for source_app, source, app, model, relation, field in COUNTERS:
+        Source = apps.get_model(source_app, source)
+        Model = apps.get_model(app, model)
+        Model.objects.update(**{field: Coalesce(Subquery(
+            Source.objects.filter(**{relation: OuterRef('pk')}).order_by(
+            ).values(relation).annotate(total=Count('pk')).values('total')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt', '0009_feedentry'),
+        ('users', '0002_popularity_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:38
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+            'ON receipt_recipe USING gin (search_vector)'
+        )
+        Recipe = apps.get_model('receipt', 'Recipe')
+        RecipeIngredient = apps.get_model('receipt', 'RecipeIngredient')
+        ingredient_names = Subquery(
+            RecipeIngredient.objects.filter(recipe=OuterRef('pk')).order_by(
+            ).values('recipe').annotate(
+                names=StringAgg('ingredients__name', ' ')
+            ).values('names'))
+        config = settings.RECIPE_SEARCH_CONFIG
+        Recipe.objects.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)
+            + SearchVector(ingredient_names, weight='C', config=config)))
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS receipt_recipe_fts '
+            'USING fts5(name, text, ingredients, '
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            'INSERT INTO receipt_recipe_fts (rowid, name, text, ingredients) '
+            'SELECT recipe.id, recipe.name, recipe.text, ('
+            "SELECT group_concat(ingredient.name, ' ') "
+            'FROM receipt_recipeingredient line '
+            'JOIN receipt_ingredient ingredient '
+            'ON ingredient.id = line.ingredients_id '
+            'WHERE line.recipe_id = recipe.id'
+            ') FROM receipt_recipe recipe'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS receipt_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt', '0011_recipe_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый индекс'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
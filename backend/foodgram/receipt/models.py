@@ -1,8 +1,13 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from pytils.translit import slugify
 
+from foodgram.mixins import CounterFieldsMixin
 from users.models import User
 
+from .storage import recipe_storage
 from .validators import validate_positive
 
 
@@ -22,6 +27,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_name_unit',
+            ),
+        )
 
     def __str__(self) -> str:
         return f'{self.name}'
@@ -59,7 +70,50 @@ class RecipeIngredient(models.Model):
                 f"- {self.amount} {self.ingredients.measurement_unit}")
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredients'),
+            ),
+        )
+
+    def latest_per_author(self, limit=None):
+        ordering = (models.F('pub_date').desc(), models.F('id').desc())
+        if limit is None:
+            return self.order_by(*ordering)
+        ranked = self.order_by().annotate(recipe_rank=models.Window(
+            RowNumber(), partition_by=models.F('author'), order_by=ordering,
+        )).values('id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE recipe_rank <= %s',
+            (*params, limit),
+        )).order_by(*ordering)
+
+    def annotate_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingList.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name="recipes",
@@ -76,19 +130,51 @@ class Recipe(models.Model):
     text = models.TextField(verbose_name='Ваш рецепт',
                             help_text='Опишите ваш рецепт')
     image = models.ImageField(upload_to='receipt/images/',
+                              storage=recipe_storage,
                               verbose_name='Загрузить фото',
                               help_text='Добавьте изображение'
                               )
+    image_thumbnail = models.ImageField(upload_to='receipt/thumbnails/',
+                                        storage=recipe_storage,
+                                        blank=True,
+                                        editable=False,
+                                        verbose_name='Миниатюра')
+    image_webp = models.ImageField(upload_to='receipt/webp/',
+                                   storage=recipe_storage,
+                                   blank=True,
+                                   editable=False,
+                                   verbose_name='Изображение WebP')
     cooking_time = models.PositiveIntegerField(
         validators=[validate_positive],
         verbose_name='Время приготовления'
         )
     pub_date = models.DateTimeField("Дата публикации", auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Добавлений в избранное')
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Добавлений в список покупок')
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name='Поисковый индекс')
+
+    counter_fields = ('favorites_count', 'in_carts_count')
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_id_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -151,6 +237,8 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = 'Избранное'
@@ -176,6 +264,8 @@ class ShoppingList(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепты',
     )
+    created = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -186,3 +276,85 @@ class ShoppingList(models.Model):
                 name='unique_shopping_cart',
             ),
         )
+
+
+class CartIngredientTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='cart_totals',
+        verbose_name='Ингредиент'
+    )
+    total = models.FloatField(default=0, verbose_name='Количество')
+    lines = models.PositiveIntegerField(
+        default=0, verbose_name='Число рецептов')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_cart_ingredient',
+            ),
+        )
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_recipe_idx',
+            ),
+        )
+
+
+class RecipeScore(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(verbose_name='Рейтинг')
+    computed_at = models.DateTimeField(verbose_name='Дата расчёта')
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = (
+            models.Index(
+                fields=('-score', '-recipe'),
+                name='recipe_score_idx',
+            ),
+        )
@@ -0,0 +1,154 @@
+import io
+import logging
+import os
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from .blobs import release_files
+from .cache import bump_recipe_versions
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+FEATURES = {'WEBP': 'webp'}
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def check_image_size(file):
+    with Image.open(file) as image:
+        width, height = image.size
+    file.seek(0)
+    return width * height <= settings.RECIPE_IMAGE_MAX_PIXELS
+
+
+def render_rendition(image, image_format, size):
+    rendition = image.copy()
+    rendition.thumbnail(size)
+    if image_format == 'JPEG' and rendition.mode == 'RGBA':
+        background = Image.new('RGB', rendition.size, 'white')
+        background.paste(rendition, mask=rendition.getchannel('A'))
+        rendition = background
+    buffer = io.BytesIO()
+    rendition.save(buffer, image_format, quality=80)
+    return buffer.getvalue(), EXTENSIONS[image_format]
+
+
+def render_renditions(data, renditions):
+    # Runs in a worker process: only bytes in, only bytes out. Each format
+    # is rendered on its own, so a missing codec costs only its rendition.
+    largest = max(size for image_format, size in renditions.values())
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image)
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    result = {}
+    failed = {}
+    for field, (image_format, size) in renditions.items():
+        feature = FEATURES.get(image_format)
+        if feature is not None and not features.check(feature):
+            failed[field] = f'Pillow собран без поддержки {image_format}'
+            continue
+        try:
+            result[field] = render_rendition(image, image_format, size)
+        except Exception:
+            failed[field] = traceback.format_exc()
+    return result, failed
+
+
+def log_failures(recipe_id, failed):
+    for field, error in failed.items():
+        logger.error(
+            'Не удалось подготовить %s рецепта %s: %s',
+            field, recipe_id, error)
+
+
+def reset_renditions(recipe):
+    for field in settings.RECIPE_IMAGE_RENDITIONS:
+        setattr(recipe, field, '')
+
+
+def read_image(name):
+    with Recipe._meta.get_field('image').storage.open(name) as file:
+        return file.read()
+
+
+def save_renditions(recipe_id, name, renditions):
+    recipes = Recipe.objects.filter(pk=recipe_id, image=name)
+    if not renditions or not recipes.exists():
+        return
+    stem = os.path.splitext(os.path.basename(name))[0]
+    saved = {}
+    for field_name, (content, extension) in renditions.items():
+        field = Recipe._meta.get_field(field_name)
+        saved[field_name] = field.storage.save(
+            field.generate_filename(None, f'{stem}.{extension}'),
+            ContentFile(content))
+    if recipes.update(**saved):
+        bump_recipe_versions([recipe_id])
+    else:
+        # The image was replaced while the renditions were being rendered.
+        release_files(saved.values())
+
+
+def render_now(recipe_id, name):
+    renditions, failed = render_renditions(
+        read_image(name), settings.RECIPE_IMAGE_RENDITIONS)
+    save_renditions(recipe_id, name, renditions)
+    log_failures(recipe_id, failed)
+    return failed
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS)
+    return executor
+
+
+def renditions_done(recipe_id, name, caller, future):
+    try:
+        renditions, failed = future.result()
+        save_renditions(recipe_id, name, renditions)
+        log_failures(recipe_id, failed)
+    except Exception:
+        logger.exception(
+            'Не удалось подготовить изображения рецепта %s', recipe_id)
+    finally:
+        if threading.get_ident() != caller:
+            connection.close()
+
+
+def submit_renditions(recipe_id, name):
+    # Runs after the commit: a failure here must not turn the already
+    # saved recipe into an error response.
+    try:
+        if not settings.IMAGE_WORKERS:
+            render_now(recipe_id, name)
+            return
+        future = get_executor().submit(
+            render_renditions, read_image(name),
+            settings.RECIPE_IMAGE_RENDITIONS)
+    except Exception:
+        logger.exception(
+            'Не удалось подготовить изображения рецепта %s', recipe_id)
+        return
+    future.add_done_callback(partial(
+        renditions_done, recipe_id, name, threading.get_ident()))
+
+
+def schedule_renditions(recipe):
+    transaction.on_commit(
+        partial(submit_renditions, recipe.pk, recipe.image.name))
@@ -0,0 +1,175 @@
+import bisect
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import CharField, Q
+from django.db.models.lookups import IContains
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import IngredientSerializer
+
+from .cache import CatalogueSnapshot, LocalCatalogue
+from .models import Ingredient
+
+WORD_RE = re.compile(r'\w+')
+VOWELS = frozenset('аеёиоуыэюяaeiouy')
+
+
+@CharField.register_lookup
+class ILikeContains(IContains):
+    # icontains compiles to UPPER(name) LIKE UPPER(...) on PostgreSQL,
+    # which the gin_trgm_ops index on the plain column cannot serve.
+    lookup_name = 'ilike_contains'
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', lhs_params + rhs_params
+
+
+def trigrams(text):
+    # Same splitting and padding as PostgreSQL pg_trgm, so similarity
+    # scores match the database implementation.
+    result = set()
+    for word in WORD_RE.findall(text.casefold()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def edit_distance(first, second):
+    # Swapping one vowel for another is the most common misspelling of an
+    # unstressed syllable ("малако"), so it costs half a substitution.
+    previous = [float(index) for index in range(len(second) + 1)]
+    for row, first_char in enumerate(first, 1):
+        current = [float(row)]
+        for column, second_char in enumerate(second, 1):
+            if first_char == second_char:
+                substitution = 0
+            elif first_char in VOWELS and second_char in VOWELS:
+                substitution = 0.5
+            else:
+                substitution = 1
+            current.append(min(
+                previous[column] + 1,
+                current[column - 1] + 1,
+                previous[column - 1] + substitution,
+            ))
+        previous = current
+    return previous[-1]
+
+
+def word_closeness(query, name):
+    # Similarity of the query to the closest run of as many words of the
+    # name, normalized by length: a typo in one word of a long name scores
+    # like the same typo in a one-word name.
+    query_words = WORD_RE.findall(query)
+    name_words = WORD_RE.findall(name)
+    query = ' '.join(query_words)
+    best = 0
+    for start in range(max(1, len(name_words) - len(query_words) + 1)):
+        words = ' '.join(name_words[start:start + len(query_words)])
+        longest = max(len(query), len(words)) or 1
+        best = max(best, 1 - edit_distance(query, words) / longest)
+    return best
+
+
+def rank_matches(query, matches, limit):
+    # The same ordering serves SQLite and PostgreSQL; the database only
+    # supplies the candidates through its trigram index.
+    ranked = []
+    for name, pk, similarity in matches:
+        if name.startswith(query):
+            match = 0
+        elif query in name:
+            match = 1
+        else:
+            match = 2
+        ranked.append(
+            (match, -word_closeness(query, name), -similarity, name, pk))
+    ranked.sort()
+    return [item[-1] for item in ranked[:limit]]
+
+
+class IngredientSnapshot(CatalogueSnapshot):
+    def __init__(self, ingredients):
+        renderer = JSONRenderer()
+        super().__init__({
+            ingredient.pk: renderer.render(
+                IngredientSerializer(ingredient).data)
+            for ingredient in ingredients
+        })
+        self.keys = sorted(
+            (ingredient.name.casefold(), ingredient.pk)
+            for ingredient in ingredients
+        )
+        self.sizes = []
+        self.postings = {}
+        for position, (name, pk) in enumerate(self.keys):
+            grams = trigrams(name)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(position)
+
+    @classmethod
+    def build(cls):
+        return cls(list(Ingredient.objects.all()))
+
+    def prefix(self, query, limit):
+        query = query.casefold()
+        start = bisect.bisect_left(self.keys, (query,))
+        result = []
+        for name, pk in self.keys[start:start + limit]:
+            if not name.startswith(query):
+                break
+            result.append(pk)
+        return result
+
+    def ranked(self, query, limit):
+        query = query.casefold()
+        query_grams = trigrams(query)
+        overlap = Counter()
+        for gram in query_grams:
+            overlap.update(self.postings.get(gram, ()))
+        matches = []
+        for position, common in overlap.items():
+            name, pk = self.keys[position]
+            similarity = common / (
+                len(query_grams) + self.sizes[position] - common or 1)
+            if (query in name
+                    or similarity >= settings.INGREDIENT_TRIGRAM_THRESHOLD):
+                matches.append((name, pk, similarity))
+        return rank_matches(query, matches, limit)
+
+
+ingredient_index = LocalCatalogue('ingredients', IngredientSnapshot.build)
+
+
+def fuzzy_search(snapshot, query, limit):
+    # Fewer than three characters carry no trigram to look up, and a scan
+    # of the whole catalogue would not keep the latency flat.
+    if len(query) < 3:
+        return snapshot.prefix(query, limit)
+    if connection.vendor != 'postgresql':
+        return snapshot.ranked(query, limit)
+    query = query.casefold()
+    query_grams = trigrams(query)
+    matches = []
+    for pk, name in Ingredient.objects.filter(
+        Q(name__ilike_contains=query) | Q(name__trigram_similar=query)
+    ).annotate(
+        similarity=TrigramSimilarity('name', query),
+    ).order_by('-similarity').values_list(
+        'id', 'name'
+    )[:settings.INGREDIENT_FUZZY_CANDIDATES]:
+        if pk not in snapshot.documents:
+            continue
+        name = name.casefold()
+        grams = trigrams(name)
+        common = len(query_grams & grams)
+        matches.append((name, pk, common / (
+            len(query_grams) + len(grams) - common or 1)))
+    return rank_matches(query, matches, limit)
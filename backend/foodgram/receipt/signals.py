@@ -0,0 +1,195 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import Subscribe, User
+
+from .blobs import recipe_file_names, release_files_on_commit
+from .cache import bump_recipe_versions, bump_table_version, bump_user_version
+from .carts import (apply_deltas, cart_users, recipe_deltas,
+                    reconcile_cart_totals)
+from .counters import shift_counter
+from .feed import backfill_timeline, prune_timeline, push_recipe
+from .fulltext import schedule_search_refresh
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                     ShoppingList, Tag)
+
+line_signals = threading.local()
+
+
+@contextmanager
+def muted_line_signals():
+    # For writers that apply a whole ingredient diff and then update the
+    # cart totals, versions and search index once for the recipe.
+    previous = getattr(line_signals, 'muted', False)
+    line_signals.muted = True
+    try:
+        yield
+    finally:
+        line_signals.muted = previous
+
+
+def line_signals_muted(sender):
+    return (sender is RecipeIngredient
+            and getattr(line_signals, 'muted', False))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    bump_recipe_versions([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        push_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    release_files_on_commit(recipe_file_names(instance))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_text_changed(sender, instance, **kwargs):
+    schedule_search_refresh([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+def recipe_relation_changed(sender, instance, **kwargs):
+    if line_signals_muted(sender):
+        return
+    bump_recipe_versions([instance.recipe_id])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_line_changed(sender, instance, **kwargs):
+    if line_signals_muted(sender):
+        return
+    schedule_search_refresh([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add':
+        bump_recipe_versions(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    bump_table_version('ingredients')
+    if not created:
+        recipe_ids = RecipeIngredient.objects.filter(
+            ingredients=instance).values_list('recipe_id', flat=True)
+        bump_recipe_versions(recipe_ids)
+        schedule_search_refresh(recipe_ids)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    bump_table_version('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+def tag_changed(sender, instance, created, **kwargs):
+    bump_table_version('tags')
+    if not created:
+        bump_recipe_versions(RecipeTag.objects.filter(
+            tag=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    bump_table_version('tags')
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    bump_recipe_versions(
+        instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def user_relation_changed(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=ShoppingList)
+def cart_recipe_added(sender, instance, created, **kwargs):
+    if created:
+        apply_deltas(recipe_deltas([instance.user_id], instance.recipe_id, 1))
+
+
+@receiver(post_delete, sender=ShoppingList)
+def cart_recipe_removed(sender, instance, **kwargs):
+    apply_deltas(recipe_deltas([instance.user_id], instance.recipe_id, -1))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def cart_line_saved(sender, instance, created, **kwargs):
+    if line_signals_muted(sender):
+        return
+    users = cart_users(instance.recipe_id)
+    if not users:
+        return
+    if created:
+        apply_deltas({
+            (user_id, instance.ingredients_id): (instance.amount, 1)
+            for user_id in users
+        })
+    else:
+        reconcile_cart_totals(users)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def cart_line_deleted(sender, instance, **kwargs):
+    if line_signals_muted(sender):
+        return
+    apply_deltas({
+        (user_id, instance.ingredients_id): (-instance.amount, -1)
+        for user_id in cart_users(instance.recipe_id)
+    })
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribed(sender, instance, created, **kwargs):
+    if created:
+        backfill_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def unsubscribed(sender, instance, **kwargs):
+    prune_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Subscribe)
+def counted_object_created(sender, instance, created, **kwargs):
+    if created:
+        shift_counter(instance, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Subscribe)
+def counted_object_deleted(sender, instance, **kwargs):
+    shift_counter(instance, -1)
@@ -0,0 +1,292 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from receipt.checks import shared_cache_check
+from receipt.fulltext import search_recipes
+from receipt.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeScore, ShoppingList)
+from receipt.search import IngredientSnapshot, fuzzy_search
+from receipt.storage import recipe_storage
+from receipt.trending import compute_trending
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    def test_unshared_backends_warn(self):
+        for backend in ('locmem.LocMemCache', 'filebased.FileBasedCache'):
+            caches = {'default': {
+                'BACKEND': f'django.core.cache.backends.{backend}'}}
+            with self.subTest(backend=backend), override_settings(
+                    CACHES=caches):
+                self.assertEqual(
+                    [warning.id for warning in shared_cache_check(None)],
+                    ['receipt.W001'])
+
+    def test_memcached_is_shared(self):
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.'
+                       'PyMemcacheCache'}}
+        with override_settings(CACHES=caches):
+            self.assertEqual(shared_cache_check(None), [])
+
+
+class IngredientSearchTests(SimpleTestCase):
+    names = (
+        'гарам масала', 'мак', 'малина', 'малина сушеная', 'малиновый джем',
+        'марсала', 'маш', 'молоко', 'молоко козье', 'морковь',
+        'морковь молодая', 'салака', 'сахар', 'сахар ванильный',
+    )
+
+    def setUp(self):
+        self.snapshot = IngredientSnapshot([
+            Ingredient(pk=pk, name=name, measurement_unit='г')
+            for pk, name in enumerate(self.names, 1)
+        ])
+
+    def search(self, query, limit=3):
+        return [self.names[pk - 1]
+                for pk in fuzzy_search(self.snapshot, query, limit)]
+
+    def test_typo_ranks_intended_word_first(self):
+        self.assertEqual(self.search('малако')[0], 'молоко')
+        self.assertEqual(self.search('марковь', 2),
+                         ['морковь', 'морковь молодая'])
+
+    def test_prefix_and_substring_come_first(self):
+        self.assertEqual(self.search('сахар', 2),
+                         ['сахар', 'сахар ванильный'])
+        self.assertEqual(self.search('козье'), ['молоко козье'])
+
+    def test_short_query_uses_prefix_only(self):
+        self.assertEqual(self.search('ма', 10),
+                         ['мак', 'малина', 'малина сушеная',
+                          'малиновый джем', 'марсала', 'маш'])
+        self.assertEqual(self.search('км'), [])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 index of SQLite')
+class RecipeFullTextTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.milk = Ingredient.objects.create(
+            name='молоко', measurement_unit='мл')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.porridge = self.create_recipe(
+                'Каша', 'Сварить на медленном огне.', self.milk)
+            self.salad = self.create_recipe('Салат', 'Нарезать овощи.')
+
+    def create_recipe(self, name, text, ingredient=None):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text=text,
+            image='receipt/images/recipe.png', cooking_time=10)
+        if ingredient is not None:
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredients=ingredient, amount=100)
+        return recipe
+
+    def search(self, value):
+        return list(search_recipes(Recipe.objects.all(), value))
+
+    def test_search_hit(self):
+        self.assertEqual(self.search('огне'), [self.porridge])
+        self.assertEqual(self.search('молоко'), [self.porridge])
+        self.assertEqual(self.search('салат'), [self.salad])
+
+    def test_recipe_edit_refreshes_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salad.name = 'Винегрет'
+            self.salad.save()
+        self.assertEqual(self.search('салат'), [])
+        self.assertEqual(self.search('винегрет'), [self.salad])
+
+    def test_ingredient_edit_refreshes_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.milk.name = 'сливки'
+            self.milk.save()
+        self.assertEqual(self.search('молоко'), [])
+        self.assertEqual(self.search('сливки'), [self.porridge])
+
+    def test_operators_are_quoted(self):
+        for value in ('каша OR салат', 'NEAR(каша', 'каша*', '"каша',
+                      'name:салат', '-каша', '^каша AND'):
+            with self.subTest(value=value):
+                self.assertNotIn(self.salad, self.search(value))
+        self.assertEqual(self.search('"каша"'), [self.porridge])
+
+    def test_empty_query(self):
+        self.assertEqual(
+            set(self.search('  ')), {self.porridge, self.salad})
+
+
+class LoadIngredientsTests(TestCase):
+    rows = [('мука', 'г'), ('молоко', 'мл'), ('соль', 'по вкусу')]
+
+    def write(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def load(self, path, *args):
+        call_command('load_ingredients', path, *args, stdout=io.StringIO())
+        return set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'))
+
+    def test_csv(self):
+        path = self.write('.csv', ''.join(
+            f'{name},{unit}\n' for name, unit in self.rows))
+        self.assertEqual(self.load(path), set(self.rows))
+
+    def test_json(self):
+        path = self.write('.json', json.dumps([
+            {'name': name, 'measurement_unit': unit}
+            for name, unit in self.rows
+        ], ensure_ascii=False))
+        # Blocks shorter than an item make the reader resume mid-object.
+        with mock.patch(
+                'receipt.management.commands.load_ingredients.'
+                'JSON_BLOCK_SIZE', 7):
+            self.assertEqual(self.load(path), set(self.rows))
+
+    def test_reload_adds_no_duplicates(self):
+        path = self.write('.csv', ''.join(
+            f'{name},{unit}\n' for name, unit in self.rows * 2))
+        self.load(path, '--chunk-size', '2')
+        self.load(path, '--chunk-size', '2')
+        self.assertEqual(Ingredient.objects.count(), len(self.rows))
+
+    def test_truncated_json(self):
+        path = self.write('.json', '[{"name": "мука", "measurement_')
+        with self.assertRaises(CommandError):
+            self.load(path)
+
+
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='Имя', last_name='Фамилия', password='password')
+            for number in range(3)
+        ]
+        self.recent, self.older = [
+            Recipe.objects.create(
+                author=self.users[0], name=name, text='Описание',
+                image='receipt/images/recipe.png', cooking_time=10)
+            for name in ('Свежий', 'Давний')
+        ]
+        for recipe in (self.recent, self.older):
+            for user in self.users:
+                Favorite.objects.create(user=user, recipe=recipe)
+            ShoppingList.objects.create(user=self.users[0], recipe=recipe)
+
+    def age(self, recipe, days):
+        created = timezone.now() - timedelta(days=days)
+        Favorite.objects.filter(recipe=recipe).update(created=created)
+        ShoppingList.objects.filter(recipe=recipe).update(created=created)
+
+    def trending(self):
+        response = self.client.get('/api/recipes/?ordering=trending')
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_newer_activity_ranks_higher(self):
+        self.age(self.older, days=3)
+        compute_trending()
+        self.assertEqual(self.trending(), [self.recent.pk, self.older.pk])
+        self.age(self.recent, days=5)
+        compute_trending()
+        self.assertEqual(self.trending(), [self.older.pk, self.recent.pk])
+
+    def test_activity_outside_window_is_ignored(self):
+        self.age(self.older, days=30)
+        compute_trending()
+        self.assertEqual(self.trending(), [self.recent.pk])
+
+    def test_recompute_replaces_scores(self):
+        compute_trending()
+        first = dict(RecipeScore.objects.values_list('recipe_id', 'score'))
+        Favorite.objects.filter(recipe=self.recent).delete()
+        self.assertEqual(compute_trending(batch_size=1), 2)
+        second = dict(RecipeScore.objects.values_list('recipe_id', 'score'))
+        self.assertEqual(RecipeScore.objects.count(), 2)
+        self.assertLess(second[self.recent.pk], first[self.recent.pk])
+        self.assertEqual(
+            list(RecipeScore.objects.values_list(
+                'computed_at', flat=True).distinct()),
+            [RecipeScore.objects.get(pk=self.older.pk).computed_at])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MediaGarbageTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+
+    def store(self, name, content, age=0):
+        name = recipe_storage.save(name, ContentFile(content))
+        stamp = time.time() - age
+        os.utime(recipe_storage.path(name), (stamp, stamp))
+        return name
+
+    def collect(self, *args):
+        call_command('collect_media_garbage', *args, stdout=io.StringIO())
+
+    def test_grace_period(self):
+        old = self.store('receipt/images/old.png', b'old', age=7200)
+        new = self.store('receipt/images/new.png', b'new', age=60)
+        self.collect('--grace', '3600')
+        self.assertFalse(recipe_storage.exists(old))
+        self.assertTrue(recipe_storage.exists(new))
+        self.collect('--grace', '0')
+        self.assertFalse(recipe_storage.exists(new))
+
+    def test_referenced_file_is_kept(self):
+        name = self.store('receipt/images/recipe.png', b'image', age=7200)
+        Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание', image=name,
+            cooking_time=10)
+        self.collect('--grace', '0')
+        self.assertTrue(recipe_storage.exists(name))
+
+    def test_files_outside_upload_prefix_are_kept(self):
+        path = os.path.join(recipe_storage.location, 'exports', 'report.csv')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as file:
+            file.write(b'report')
+        os.utime(path, (0, 0))
+        self.collect('--grace', '0')
+        self.assertTrue(os.path.exists(path))
+
+    def test_identical_content_is_stored_once(self):
+        first = self.store('receipt/images/first.png', b'same')
+        second = self.store('receipt/images/second.PNG', b'same')
+        other = self.store('receipt/images/first.png', b'other')
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(recipe_storage.is_hashed(first))
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(recipe_storage.path(first)))), 1)
@@ -0,0 +1,40 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_table_version
+from .models import Favorite, RecipeScore, ShoppingList
+
+EVENT_WEIGHTS = {
+    Favorite: 1.0,
+    ShoppingList: 2.0,
+}
+
+
+def decayed_scores(now):
+    since = now - timedelta(seconds=settings.TRENDING_WINDOW)
+    scores = defaultdict(float)
+    for model, weight in EVENT_WEIGHTS.items():
+        events = model.objects.filter(created__gte=since).values_list(
+            'recipe_id', 'created')
+        for recipe_id, created in events.iterator():
+            age = (now - created).total_seconds()
+            scores[recipe_id] += weight * 0.5 ** (
+                age / settings.TRENDING_HALF_LIFE)
+    return scores
+
+
+def compute_trending(batch_size=1000):
+    now = timezone.now()
+    scores = decayed_scores(now)
+    with transaction.atomic():
+        RecipeScore.objects.all().delete()
+        RecipeScore.objects.bulk_create((
+            RecipeScore(recipe_id=recipe_id, score=score, computed_at=now)
+            for recipe_id, score in scores.items()
+        ), batch_size=batch_size)
+    bump_table_version('recipes')
+    return len(scores)
@@ -1,21 +1,91 @@
-from django.db.models import Sum
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
 from django.db.utils import IntegrityError
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, mixins, permissions, status, viewsets
+from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
-from api.serializers import (FavoriteSerializer, IngredientSerializer,
+from api.serializers import (CartIngredientTotalSerializer,
+                             FavoriteSerializer, IngredientSerializer,
                              RecipeReadSerializer, RecipeSerializer,
                              ShoppingListSerializer, TagSerializer)
-from foodgram.pagination import LimitPageNumberPagination
+from foodgram.pagination import KeysetPagination, LimitPageNumberPagination
 from foodgram.permissions import IsAuthorOrAdminOrReadOnly
-from receipt.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+from receipt.cache import (RECIPE_VERSION_KEY, TABLE_VERSION_KEY,
+                           USER_VERSION_KEY, CatalogueSnapshot,
+                           LocalCatalogue, get_versions)
+from receipt.models import (CartIngredientTotal, Favorite, Ingredient, Recipe,
                             ShoppingList, Tag)
+from users.models import Subscribe
 
+from .exports import SHOPPING_LIST_RENDERERS
+from .feed import feed_recipes
 from .filters import RecipeFilter
+from .search import fuzzy_search, ingredient_index
+
+
+def build_tag_catalogue():
+    renderer = JSONRenderer()
+    return CatalogueSnapshot({
+        tag.pk: renderer.render(TagSerializer(tag).data)
+        for tag in Tag.objects.all()
+    })
+
+
+tag_catalogue = LocalCatalogue('tags', build_tag_catalogue)
+
+
+class ConditionalGetMixin:
+    version_table = None
+    personalized = True
+
+    def get_version_keys(self):
+        keys = [TABLE_VERSION_KEY.format(self.version_table)]
+        if self.personalized and self.request.user.is_authenticated:
+            keys.append(USER_VERSION_KEY.format(self.request.user.pk))
+        return keys
+
+    def get_etag(self, request):
+        keys = self.get_version_keys()
+        self.versions = get_versions(keys)
+        value = '|'.join([
+            request.get_full_path(),
+            str(request.user.pk) if self.personalized else '',
+            *(str(self.versions[key]) for key in keys),
+        ])
+        return quote_etag(hashlib.md5(value.encode()).hexdigest())
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        response = None
+        if etag is not None:
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if etag is not None and response.status_code in (
+                status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
 
 
 class ListRetrieveViewSet(mixins.ListModelMixin,
@@ -24,6 +94,39 @@ class ListRetrieveViewSet(mixins.ListModelMixin,
     pass
 
 
+class CatalogueViewSet(ConditionalGetMixin, ListRetrieveViewSet):
+    catalogue = None
+    personalized = False
+    pagination_class = None
+    permission_classes = (permissions.AllowAny,)
+
+    def get_snapshot(self):
+        return self.catalogue.get(self.versions.get(self.catalogue.key))
+
+    def render_catalogue(self, content):
+        return HttpResponse(content, content_type='application/json')
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(self.list_catalogue, request)
+
+    def list_catalogue(self, request):
+        return self.render_catalogue(self.get_snapshot().render())
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.retrieve_catalogue, request, *args, **kwargs)
+
+    def retrieve_catalogue(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs['pk'])
+        except ValueError:
+            raise Http404
+        document = self.get_snapshot().documents.get(pk)
+        if document is None:
+            raise Http404
+        return self.render_catalogue(document)
+
+
 class ListCreatDeleteViewSet(mixins.ListModelMixin,
                              mixins.CreateModelMixin,
                              mixins.DestroyModelMixin,
@@ -31,12 +134,58 @@ class ListCreatDeleteViewSet(mixins.ListModelMixin,
     pass
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    parser_classes = (JSONParser, MultiPartParser)
     pagination_class = LimitPageNumberPagination
+    cursor_pagination_class = KeysetPagination
+    version_table = 'recipes'
     permission_classes = (IsAuthorOrAdminOrReadOnly, )
     filterset_class = RecipeFilter
     filter_backends = (DjangoFilterBackend,)
+    lookup_value_regex = r'\d+'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_param = self.cursor_pagination_class.cursor_query_param
+            params = self.request.query_params
+            # The cursor encodes a (pub_date, id) position, so the other
+            # orderings are paginated by page number.
+            if cursor_param in params and not params.get('ordering'):
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_version_keys(self):
+        keys = super().get_version_keys()
+        if self.action == 'retrieve':
+            keys[0] = RECIPE_VERSION_KEY.format(self.kwargs['pk'])
+        return keys
+
+    def get_etag(self, request):
+        if self.action == 'retrieve':
+            # A recipe version is created when its document is rendered,
+            # never for a pk that only appeared in a URL.
+            key = RECIPE_VERSION_KEY.format(self.kwargs['pk'])
+            if cache.get(key) is None:
+                return None
+        return super().get_etag(request)
+
+    def get_queryset(self):
+        return Recipe.objects.with_related().annotate_user_flags(
+            self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        user = self.request.user
+        if user.is_anonymous:
+            context['subscriptions'] = set()
+        else:
+            context['subscriptions'] = set(
+                Subscribe.objects.filter(user=user).values_list(
+                    'author_id', flat=True))
+        return context
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -111,26 +260,44 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, permission_classes=[permissions.IsAuthenticated])
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user).values(
-            'ingredients__name',
-            'ingredients__measurement_unit').annotate(total=Sum('amount'))
-        shopping_list = 'Cписок покупок:\n'
-        if ingredients:
-            for number, ingredient in enumerate(ingredients, start=1):
-                shopping_list += (
-                    f'{number} '
-                    f'{ingredient["ingredients__name"]} - '
-                    f'{ingredient["total"]} '
-                    f'{ingredient["ingredients__measurement_unit"]}\n')
-
-            purchase_list = 'purchase_list.txt'
-            response = HttpResponse(shopping_list,
-                                    content_type='text/plain')
-            response['Content-Disposition'] = (f'attachment;'
-                                               f'filename={purchase_list}')
-            return response
-        return HttpResponse('Список пуст')
+        file_format = request.query_params.get('file_format', 'txt')
+        renderer_class = SHOPPING_LIST_RENDERERS.get(file_format)
+        if renderer_class is None:
+            return Response('Неизвестный формат файла',
+                            status=status.HTTP_400_BAD_REQUEST)
+        ingredients = CartIngredientTotal.objects.filter(
+            user=request.user
+        ).values(
+            'total',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).order_by('name')
+        if not ingredients.exists():
+            return HttpResponse('Список пуст')
+        renderer = renderer_class()
+        response = StreamingHttpResponse(
+            renderer.render(ingredients.iterator()),
+            content_type=renderer.content_type)
+        response['Content-Disposition'] = (
+            f'attachment;filename=purchase_list.{renderer.extension}')
+        return response
+
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        paginator = self.cursor_pagination_class()
+        page = paginator.paginate_fetch(
+            partial(feed_recipes, request.user), request, view=self)
+        serializer = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated])
+    def shopping_cart_summary(self, request):
+        totals = CartIngredientTotal.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        serializer = CartIngredientTotalSerializer(totals, many=True)
+        return Response(serializer.data)
 
 
 class FavoriteViewSet(ListCreatDeleteViewSet):
@@ -138,17 +305,40 @@ class FavoriteViewSet(ListCreatDeleteViewSet):
     serializer_class = FavoriteSerializer
 
 
-class GetIngredientViewSet(ListRetrieveViewSet):
+class GetIngredientViewSet(CatalogueViewSet):
+    version_table = 'ingredients'
+    catalogue = ingredient_index
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    pagination_class = None
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['^name']
-    permission_classes = (permissions.AllowAny,)
+    search_query_params = ('name', 'search')
 
+    def get_search_query(self):
+        for param in self.search_query_params:
+            if param in self.request.query_params:
+                return self.request.query_params[param].strip()
+        return ''
 
-class TagViewSet(ListRetrieveViewSet):
+    def get_search_limit(self):
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        try:
+            requested = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            return limit
+        return min(requested, limit) if requested > 0 else limit
+
+    def list_catalogue(self, request):
+        snapshot = self.get_snapshot()
+        query = self.get_search_query()
+        limit = self.get_search_limit()
+        fuzzy = request.query_params.get('fuzzy') in ('1', 'true')
+        ingredients = [] if fuzzy else snapshot.prefix(query, limit)
+        if query and not ingredients:
+            ingredients = fuzzy_search(snapshot, query, limit)
+        return self.render_catalogue(snapshot.render(ingredients))
+
+
+class TagViewSet(CatalogueViewSet):
+    version_table = 'tags'
+    catalogue = tag_catalogue
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    permission_classes = (permissions.AllowAny,)
-    pagination_class = None
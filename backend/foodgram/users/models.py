@@ -2,12 +2,19 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.urls import reverse
 
+from foodgram.mixins import CounterFieldsMixin
 
-class User(AbstractUser):
+
+class User(CounterFieldsMixin, AbstractUser):
     email = models.EmailField('Email', max_length=254, unique=True)
     username = models.CharField('Username', max_length=150, unique=True)
     first_name = models.CharField('Name', max_length=150)
     last_name = models.CharField('Surname', max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        'Recipes', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Followers', default=0, editable=False, db_index=True)
+    counter_fields = ('recipes_count', 'followers_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
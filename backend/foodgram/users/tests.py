@@ -0,0 +1,68 @@
+from django.test import TestCase
+from django.urls import resolve, reverse
+from djoser.urls.base import router as djoser_router
+from rest_framework.test import APIClient
+
+from users.models import Subscribe, User
+from users.urls import router
+from users.views import UserViewSet
+
+
+class UserRouteTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_routes_match_djoser(self):
+        self.assertEqual(
+            [(url.name, str(url.pattern)) for url in router.urls],
+            [(url.name, str(url.pattern)) for url in djoser_router.urls])
+
+    def test_urls_and_names(self):
+        for name, kwargs, path in (
+                ('users:user-list', {}, '/api/users/'),
+                ('users:user-detail', {'id': 1}, '/api/users/1/'),
+                ('users:user-me', {}, '/api/users/me/'),
+                ('users:user-set-password', {}, '/api/users/set_password/'),
+                ('users:subscription', {}, '/api/users/subscriptions/'),
+                ('users:subscribe', {'id': 1}, '/api/users/1/subscribe/')):
+            with self.subTest(name=name):
+                self.assertEqual(reverse(name, kwargs=kwargs), path)
+        self.assertIs(resolve('/api/users/me/').func.cls, UserViewSet)
+
+    def test_me(self):
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], 'user@example.com')
+        self.assertFalse(response.json()['is_subscribed'])
+
+    def test_set_password(self):
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'password',
+            'new_password': 'Nov0e-parol-123',
+        })
+        self.assertEqual(response.status_code, 204, response.content)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Nov0e-parol-123'))
+
+    def test_is_subscribed(self):
+        Subscribe.objects.create(user=self.user, author=self.author)
+        response = self.client.get(f'/api/users/{self.author.pk}/')
+        self.assertTrue(response.json()['is_subscribed'])
+        listed = {
+            user['id']: user['is_subscribed']
+            for user in self.client.get('/api/users/').json()['results']
+        }
+        self.assertEqual(
+            listed, {self.user.pk: False, self.author.pk: True})
+        response = APIClient().get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            user['is_subscribed'] for user in response.json()['results']))
@@ -1,13 +1,17 @@
 from django.urls import include, path
+from rest_framework.routers import DefaultRouter
 
-from users.views import SubscribeListView, SubscribeView
+from users.views import SubscribeListView, SubscribeView, UserViewSet
 
 app_name = 'users'
 
+router = DefaultRouter()
+router.register('users', UserViewSet)
+
 urlpatterns = [
     path('users/subscriptions/', SubscribeListView.as_view(),
          name='subscription'),
     path('users/<int:id>/subscribe/', SubscribeView.as_view(),
          name='subscribe'),
-    path('', include('djoser.urls')),
+    path('', include(router.urls)),
 ]
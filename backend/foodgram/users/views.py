@@ -1,11 +1,15 @@
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status
 from rest_framework.generics import ListAPIView, get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.serializers import SubscribeListSerializer, SubscribeSerializer
+from api.serializers import (SubscribeListSerializer, SubscribeSerializer,
+                             get_recipes_limit)
 from foodgram.pagination import LimitPageNumberPagination
+from receipt.models import Recipe
 
 from .models import Subscribe, User
 
@@ -40,10 +44,33 @@ class SubscribeListView(ListAPIView):
     permission_classes = [IsAuthenticated, ]
 
     def get(self, request):
+        authors = self.paginate_queryset(
+            User.objects.filter(subscribing__user=request.user).annotate(
+                is_subscribed=Value(True, output_field=BooleanField()),
+            ))
+        recipes_by_author = {author.pk: [] for author in authors}
+        recipes = Recipe.objects.filter(
+            author__in=recipes_by_author
+        ).latest_per_author(get_recipes_limit(request)).only(
+            'id', 'author_id', 'name', 'image', 'cooking_time')
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
         serializer = SubscribeListSerializer(
-            self.paginate_queryset(
-                User.objects.filter(subscribing__user=request.user)),
-            context={'request': request},
+            authors,
+            context={'request': request,
+                     'recipes_by_author': recipes_by_author},
             many=True
         )
         return self.get_paginated_response(serializer.data)
+
+
+class UserViewSet(DjoserUserViewSet):
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()))
+        return queryset.annotate(is_subscribed=Exists(
+            Subscribe.objects.filter(user=user, author=OuterRef('pk'))))